@@ -6,7 +6,9 @@ Telegram бот для управления расписанием
 
 import json
 import os
+import re
 import asyncio
+import bisect
 import random
 import logging
 import fcntl
@@ -15,23 +17,44 @@ import signal
 import shutil
 import time
 import base64
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Callable, Any
-from functools import wraps
-from zoneinfo import ZoneInfo
+import copy
+import heapq
+import queue
+import threading
+from datetime import datetime, timedelta, date, time as dtime
+from typing import Dict, List, Optional, Callable, Any, Tuple, Set
+from functools import wraps, lru_cache
+from itertools import groupby
+from contextlib import contextmanager
+from dataclasses import dataclass
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 # Импорты для определения часового пояса по городу (опциональные)
 try:
     from geopy.geocoders import Nominatim
-    from timezonefinder import TimezoneFinder
+    try:
+        # tzfpy (Rust) быстрее timezonefinder и не держит полигоны в памяти Python; timezonefinder - запасной вариант
+        from tzfpy import get_tz
+        TimezoneFinder = None
+    except ImportError:
+        get_tz = None
+        from timezonefinder import TimezoneFinder
     GEOCODING_AVAILABLE = True
 except ImportError as e:
     GEOCODING_AVAILABLE = False
     # logger будет определен позже, поэтому используем print для предупреждения
     import sys
-    print(f"⚠️  Библиотеки geopy и timezonefinder не установлены: {e}", file=sys.stderr)
+    print(f"⚠️  Библиотеки geopy и tzfpy не установлены: {e}", file=sys.stderr)
     print("⚠️  Автоматическое определение часового пояса будет недоступно.", file=sys.stderr)
-    print("⚠️  Для установки выполните: pip install geopy timezonefinder", file=sys.stderr)
+    print("⚠️  Для установки выполните: python setup_deps.py", file=sys.stderr)
+
+# Быстрая сериализация JSON (опционально, при отсутствии используется стандартный json)
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, BotCommand
 from telegram.ext import (
     Application,
@@ -40,9 +63,10 @@ from telegram.ext import (
     MessageHandler,
     ContextTypes,
     ConversationHandler,
+    BaseRateLimiter,
     filters
 )
-from telegram.error import Conflict, RetryAfter, TimedOut, NetworkError, TelegramError
+from telegram.error import BadRequest, Conflict, RetryAfter, TimedOut, NetworkError, TelegramError
 
 # Состояния для ConversationHandler
 (WAITING_TITLE, WAITING_DATE, WAITING_TIME, WAITING_DESCRIPTION, 
@@ -50,12 +74,43 @@ from telegram.error import Conflict, RetryAfter, TimedOut, NetworkError, Telegra
  WAITING_CATEGORY_NAME, WAITING_CATEGORY_EDIT_NAME, WAITING_CATEGORY_DELETE_CONFIRM, WAITING_CITY) = range(13)
 
 # Файл для хранения данных
-DATA_FILE = 'schedule_data.json'
+DATA_FILE = 'schedule_data.json'  # Старый общий файл событий (переносится в EVENTS_DIR при первом запуске)
+EVENTS_DIR = 'schedule_events'  # Папка с событиями по пользователям: {user_id}.json
+EVENTS_LOCK_FILE = '.lock'  # Общая блокировка записи файлов в EVENTS_DIR
 MESSAGES_FILE = 'user_messages.json'  # Файл для хранения ID сообщений бота
 USER_MESSAGES_FILE = 'user_sent_messages.json'  # Файл для хранения ID сообщений пользователя
 CATEGORIES_FILE = 'user_categories.json'  # Файл для хранения категорий пользователей
 USER_SETTINGS_FILE = 'user_settings.json'  # Файл для хранения настроек пользователей (город, часовой пояс)
+CITY_TIMEZONES_FILE = 'city_timezones.json'  # Кэш определения часового пояса по городу (город -> часовой пояс)
+CITY_NOT_FOUND_TTL = 24 * 60 * 60  # Сколько секунд помнить, что город не найден (опечатки)
+CITY_TIMEZONES_MAX = 4096  # Максимум городов в кэше
 LOCK_FILE = 'bot.lock'  # Файл блокировки для предотвращения множественных запусков
+FLUSH_DELAY = 0.25  # Задержка отложенной записи кэшей на диск (секунды)
+DELETE_MESSAGES_BATCH = 100  # Максимум ID сообщений в одном запросе deleteMessages (Bot API 7.0)
+DELETE_MESSAGES_CONCURRENCY = 4  # Одновременных запросов удаления (не больше - общий лимит Telegram ~30 запросов/с)
+DELETE_SINGLE_CONCURRENCY = 20  # Одновременных поштучных удалений, если пачку Telegram отклонил целиком
+PINNED_CACHE_TTL = 60  # Секунд, в течение которых закрепленное сообщение чата не запрашивается повторно
+FSYNC_DELAY = 0.2  # Максимальная задержка сброса на диск (fsync) файла событий (секунды)
+MESSAGES_LOG_FILE = 'user_messages.log'  # Журнал дозаписи новых ID сообщений бота (между снимками MESSAGES_FILE)
+MESSAGES_LOG_COMPACT_EVERY = 1000  # Сжатие журнала в снимок после стольких добавлений
+MESSAGES_LOG_COMPACT_INTERVAL = 300  # ...или не реже чем раз в столько секунд
+GLOBAL_RATE_LIMIT = 30  # Запросов к Bot API в секунду на всего бота (лимит Telegram ~30/с)
+CHAT_RATE_LIMIT = 1  # Отправок сообщений в секунду в один чат (рекомендация Telegram)
+CHAT_RATE_BURST = 3  # Сколько сообщений в чат можно отправить подряд без ожидания
+
+# Режим webhook (если WEBHOOK_URL не задан, используется long polling)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный HTTPS адрес бота, например https://example.com
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8443')))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Проверка заголовка X-Telegram-Bot-Api-Secret-Token
+
+# HTTP соединения с Bot API: постоянный пул keep-alive соединений общий для всех запросов
+BOT_API_URL = os.getenv('BOT_API_URL')  # Свой сервер Bot API (telegram-bot-api), например http://localhost:8081
+BOT_API_CONNECTION_POOL = 256  # Соединений в пуле (параллельные пачки удаления и отправки не ждут друг друга)
+BOT_API_CONNECT_TIMEOUT = 5.0
+BOT_API_READ_TIMEOUT = 10.0
+BOT_API_WRITE_TIMEOUT = 10.0
+BOT_API_POOL_TIMEOUT = 3.0
 
 # Настройка логирования
 logging.basicConfig(
@@ -70,36 +125,10 @@ logger = logging.getLogger(__name__)
 
 # Логируем статус библиотек для диагностики
 if GEOCODING_AVAILABLE:
-    logger.info("✅ Библиотеки geopy и timezonefinder успешно загружены. Автоматическое определение часового пояса доступно.")
+    logger.info(f"✅ Библиотеки geopy и {'tzfpy' if get_tz else 'timezonefinder'} успешно загружены. Автоматическое определение часового пояса доступно.")
 else:
-    logger.warning("⚠️  Библиотеки geopy и timezonefinder не установлены. Автоматическое определение часового пояса недоступно.")
-    logger.warning("⚠️  Попытка автоматической установки...")
-    
-    # Попытка автоматической установки библиотек
-    try:
-        import subprocess
-        import sys
-        
-        # Пытаемся установить библиотеки
-        logger.info("📦 Установка geopy...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "--quiet", "geopy==2.4.1"], 
-                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        
-        logger.info("📦 Установка timezonefinder...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "--quiet", "timezonefinder==6.2.0"], 
-                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        
-        # Пытаемся импортировать снова
-        try:
-            from geopy.geocoders import Nominatim
-            from timezonefinder import TimezoneFinder
-            GEOCODING_AVAILABLE = True
-            logger.info("✅ Библиотеки успешно установлены и загружены!")
-        except ImportError:
-            logger.warning("⚠️  Не удалось загрузить библиотеки после установки. Требуется перезапуск бота.")
-    except Exception as e:
-        logger.warning(f"⚠️  Не удалось автоматически установить библиотеки: {e}")
-        logger.warning("⚠️  Для установки выполните: pip install geopy timezonefinder")
+    logger.warning("⚠️  Библиотеки geopy и tzfpy не установлены. Автоматическое определение часового пояса недоступно.")
+    logger.warning("⚠️  Для установки выполните: python setup_deps.py")
 
 # Глобальная переменная для graceful shutdown
 shutdown_requested = False
@@ -108,69 +137,71 @@ application_instance = None
 
 def signal_handler(signum, frame):
     """Обработчик сигналов для graceful shutdown"""
-    global shutdown_requested, application_instance
+    global shutdown_requested
     logger.info(f"📶 Получен сигнал {signum}. Начинаем graceful shutdown...")
     shutdown_requested = True
     
-    if application_instance:
-        try:
-            # Останавливаем бота корректно
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(application_instance.stop())
-            loop.run_until_complete(application_instance.shutdown())
-            loop.close()
-            logger.info("✅ Бот корректно остановлен")
-        except Exception as e:
-            logger.error(f"❌ Ошибка при остановке бота: {e}")
-    
-    sys.exit(0)
+    if application_instance and application_instance.running:
+        # Останавливаем работающий event loop приложения; run_polling/run_webhook
+        # сами завершат работу, а блок finally в main() сохранит данные
+        application_instance.stop_running()
+    else:
+        sys.exit(0)
 
 
 def retry_on_error(max_retries: int = 3, delay: float = 1.0, backoff: float = 2.0):
-    """Декоратор для повторных попыток при ошибках"""
+    """Декоратор для повторных попыток при ошибках
+    Первая попытка выполняется без накладных расходов, цикл повторов запускается только после ошибки"""
+    # Задержки между попытками вычисляются один раз при декорировании
+    delays = tuple(delay * backoff ** attempt for attempt in range(max_retries))
+    network_errors = (RetryAfter, TimedOut, NetworkError)
+    
     def decorator(func: Callable) -> Callable:
+        async def retry_async(args, kwargs, error: Exception):
+            for attempt in range(max_retries):
+                if attempt:
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        error = e
+                if isinstance(error, network_errors):
+                    wait_time = error.retry_after if isinstance(error, RetryAfter) else delays[attempt]
+                elif attempt == max_retries - 1:
+                    raise error
+                else:
+                    wait_time = delays[attempt]
+                logger.warning(f"⚠️  Попытка {attempt + 1}/{max_retries} не удалась: {error}. Повтор через {wait_time}с")
+                await asyncio.sleep(wait_time)
+            raise error
+        
+        def retry_sync(args, kwargs, error: Exception):
+            for attempt in range(max_retries):
+                if attempt:
+                    try:
+                        return func(*args, **kwargs)
+                    except Exception as e:
+                        error = e
+                if attempt == max_retries - 1:
+                    raise error
+                logger.warning(f"⚠️  Попытка {attempt + 1}/{max_retries} не удалась: {error}. Повтор через {delays[attempt]}с")
+                time.sleep(delays[attempt])
+            raise error
+        
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
-            last_exception = None
-            current_delay = delay
-            for attempt in range(max_retries):
-                try:
-                    return await func(*args, **kwargs)
-                except (RetryAfter, TimedOut, NetworkError) as e:
-                    last_exception = e
-                    if isinstance(e, RetryAfter):
-                        wait_time = e.retry_after
-                    else:
-                        wait_time = current_delay
-                    logger.warning(f"⚠️  Попытка {attempt + 1}/{max_retries} не удалась: {e}. Повтор через {wait_time}с")
-                    await asyncio.sleep(wait_time)
-                    current_delay *= backoff
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        raise
-                    logger.warning(f"⚠️  Попытка {attempt + 1}/{max_retries} не удалась: {e}. Повтор через {current_delay}с")
-                    await asyncio.sleep(current_delay)
-                    current_delay *= backoff
-            if last_exception:
-                raise last_exception
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            return await retry_async(args, kwargs, error)
         
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
-            last_exception = None
-            current_delay = delay
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    last_exception = e
-                    if attempt == max_retries - 1:
-                        raise
-                    logger.warning(f"⚠️  Попытка {attempt + 1}/{max_retries} не удалась: {e}. Повтор через {current_delay}с")
-                    time.sleep(current_delay)
-                    current_delay *= backoff
-            if last_exception:
-                raise last_exception
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            return retry_sync(args, kwargs, error)
         
         if asyncio.iscoroutinefunction(func):
             return async_wrapper
@@ -179,21 +210,71 @@ def retry_on_error(max_retries: int = 3, delay: float = 1.0, backoff: float = 2.
     return decorator
 
 
-def atomic_write(file_path: str, data: Any, backup: bool = True):
-    """Атомарная запись в файл с созданием backup"""
+def _refresh_backup(file_path: str, backup_path: str):
+    """Обновление backup через жесткую ссылку вместо копирования файла.
+    os.replace в atomic_write разрывает ссылку, и backup сохраняет прежнюю версию"""
+    try:
+        os.unlink(backup_path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(file_path, backup_path)
+    except OSError:
+        # Файловая система без поддержки жестких ссылок (EXDEV, EPERM и т.п.)
+        shutil.copy2(file_path, backup_path)
+
+
+def _dump_json(data: Any, f, pretty: bool):
+    """Сериализация JSON в открытый бинарный файл"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        f.write(orjson.dumps(data, option=option))
+    elif pretty:
+        f.write(json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+    else:
+        f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+@contextmanager
+def _file_lock(file_path: str):
+    """Межпроцессная блокировка файла данных (fcntl.flock на соседнем .lock файле).
+    Файлы событий пользователей используют одну общую блокировку папки, а не .lock на каждого пользователя"""
+    if os.path.dirname(file_path) == EVENTS_DIR:
+        lock_path = os.path.join(EVENTS_DIR, EVENTS_LOCK_FILE)
+    else:
+        lock_path = f"{file_path}.lock"
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(file_path: str, data: Any, backup: bool = True, durable: bool = False, pretty: bool = False):
+    """Атомарная запись в файл с созданием backup под межпроцессной блокировкой"""
+    with _file_lock(file_path):
+        _atomic_write_locked(file_path, data, backup, durable, pretty)
+
+
+def _atomic_write_locked(file_path: str, data: Any, backup: bool, durable: bool, pretty: bool):
+    """Атомарная запись в файл с созданием backup
+    durable=True сразу сбрасывает данные на диск (fsync); файл событий вместо этого использует schedule_fsync
+    pretty=True записывает JSON с отступами, иначе в компактном виде (служебные файлы)"""
     temp_path = f"{file_path}.tmp"
     backup_path = f"{file_path}.bak"
     
     try:
         # Создаем backup существующего файла
         if backup and os.path.exists(file_path):
-            shutil.copy2(file_path, backup_path)
+            _refresh_backup(file_path, backup_path)
         
         # Записываем во временный файл
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.flush()
-            os.fsync(f.fileno())  # Принудительная запись на диск
+        with open(temp_path, 'wb') as f:
+            _dump_json(data, f, pretty)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())  # Принудительная запись на диск
         
         # Атомарно заменяем оригинальный файл
         os.replace(temp_path, file_path)
@@ -215,31 +296,145 @@ def atomic_write(file_path: str, data: Any, backup: bool = True):
                 pass
         raise
 
+
+# Отложенная запись: путь к файлу -> последний снимок данных
+_pending_writes: Dict[str, Any] = {}
+_flush_handle = None
+
+# Фоновый поток записи, чтобы файловый ввод-вывод не блокировал event loop
+_writer_queue: "queue.Queue[Tuple[str, Any, Optional[Callable]]]" = queue.Queue()
+_writer_thread: Optional[threading.Thread] = None
+
+
+@retry_on_error(max_retries=3, delay=0.5)
+def _write_pending_file(file_path: str, data: Any):
+    """Запись снимка данных из очереди отложенной записи"""
+    if os.path.dirname(file_path) == EVENTS_DIR:
+        # Файлы событий пишутся читаемыми и сбрасываются на диск (fsync) отложенно, один раз на пачку
+        atomic_write(file_path, data, backup=True, pretty=True)
+        schedule_fsync(file_path)
+    else:
+        atomic_write(file_path, data, backup=True)
+
+
+def _writer_loop():
+    """Цикл фонового потока записи: из накопившихся в очереди снимков пишется только последний для каждого файла"""
+    while True:
+        items = [_writer_queue.get()]
+        while True:
+            try:
+                items.append(_writer_queue.get_nowait())
+            except queue.Empty:
+                break
+        batch = {file_path: (data, after_write) for file_path, data, after_write in items}
+        for file_path, (data, after_write) in batch.items():
+            try:
+                _write_pending_file(file_path, data)
+                # Действие после успешной записи снимка (например, сжатие журнала)
+                if after_write is not None:
+                    after_write()
+            except Exception as e:
+                logger.error(f"❌ Ошибка при отложенной записи {file_path}: {e}")
+        for _ in items:
+            _writer_queue.task_done()
+
+
+def _ensure_writer_thread():
+    """Запуск фонового потока записи при первом обращении"""
+    global _writer_thread
+    if _writer_thread is None or not _writer_thread.is_alive():
+        _writer_thread = threading.Thread(target=_writer_loop, name='json-writer', daemon=True)
+        _writer_thread.start()
+
+
+def flush_pending_writes():
+    """Передача всех накопленных изменений в фоновый поток записи"""
+    global _flush_handle
+    _flush_handle = None
+    if not _pending_writes:
+        return
+    _ensure_writer_thread()
+    while _pending_writes:
+        file_path, data = _pending_writes.popitem()
+        # Снимок сообщений покрывает журнал дозаписи до текущей позиции
+        after_write = _messages_log_checkpoint() if file_path == MESSAGES_FILE else None
+        # Копия нужна, т.к. кэш продолжает изменяться в event loop во время записи
+        _writer_queue.put((file_path, copy.deepcopy(data), after_write))
+
+
+# Файлы, записанные без fsync: сброс на диск выполняется одним вызовом на пачку изменений
+_pending_fsync: set = set()
+_fsync_lock = threading.Lock()
+_fsync_timer: Optional[threading.Timer] = None
+
+
+def fsync_pending_files():
+    """Сброс на диск (fsync) всех файлов, ожидающих синхронизации"""
+    global _fsync_timer
+    with _fsync_lock:
+        paths = list(_pending_fsync)
+        _pending_fsync.clear()
+        if _fsync_timer is not None:
+            _fsync_timer.cancel()
+            _fsync_timer = None
+    for file_path in paths:
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            # Синхронизируем каталог, чтобы сохранить результат os.replace
+            dir_fd = os.open(os.path.dirname(os.path.abspath(file_path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError as e:
+            logger.error(f"❌ Ошибка fsync для {file_path}: {e}")
+
+
+def schedule_fsync(file_path: str):
+    """Планирование отложенного fsync: изменения в пределах FSYNC_DELAY сбрасываются на диск вместе"""
+    global _fsync_timer
+    with _fsync_lock:
+        _pending_fsync.add(file_path)
+        if _fsync_timer is None:
+            _fsync_timer = threading.Timer(FSYNC_DELAY, fsync_pending_files)
+            _fsync_timer.daemon = True
+            _fsync_timer.start()
+
+
+def wait_for_pending_writes():
+    """Дожидаемся записи на диск всех изменений (при завершении работы)"""
+    flush_pending_writes()
+    _writer_queue.join()
+    fsync_pending_files()
+
+
+def schedule_write(file_path: str, data: Any):
+    """Планирование отложенной записи: изменения в пределах FLUSH_DELAY объединяются в одну запись"""
+    global _flush_handle
+    _pending_writes[file_path] = data
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Вне event loop (например, при запуске) пишем сразу
+        flush_pending_writes()
+        return
+    if _flush_handle is None:
+        _flush_handle = loop.call_later(FLUSH_DELAY, flush_pending_writes)
+
+
 # Стандартные категории по умолчанию (используются только при первом запуске)
 DEFAULT_CATEGORIES = {
     'other': 'остальное'
 }
 
-# Дни недели на русском
-WEEKDAYS = {
-    0: 'Понедельник',
-    1: 'Вторник',
-    2: 'Среда',
-    3: 'Четверг',
-    4: 'Пятница',
-    5: 'Суббота',
-    6: 'Воскресенье'
-}
+# Дни недели на русском (индекс - datetime.weekday())
+WEEKDAYS = ('Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье')
 
-WEEKDAYS_SHORT = {
-    0: 'Пн',
-    1: 'Вт',
-    2: 'Ср',
-    3: 'Чт',
-    4: 'Пт',
-    5: 'Сб',
-    6: 'Вс'
-}
+WEEKDAYS_SHORT = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
 
 # Месяцы на русском
 MONTHS_RU = {
@@ -257,6 +452,16 @@ MONTHS_RU = {
     'декабря': 12, 'декабрь': 12
 }
 
+# Ответ, когда событий нет
+NO_EVENTS_TEXT = "Может устроить день дурака?"
+# Ответ, когда событие по ID не найдено, и подпись к списку событий для редактирования
+EVENT_NOT_FOUND_TEXT = "Событие не найдено."
+SELECT_EVENT_TO_EDIT_TEXT = "Выберите событие для редактирования:"
+
+# Названия месяцев в родительном падеже для отображения дат
+MONTH_NAMES_RU = ('', 'января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+                  'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря')
+
 # Относительные даты
 RELATIVE_DATES = {
     'сегодня': 0,
@@ -265,14 +470,7 @@ RELATIVE_DATES = {
     'через день': 2,
     'через 2 дня': 2,
     'через 3 дня': 3,
-    'через неделю': 7,
-    # Добавляем варианты с заглавной буквой и другими возможными написаниями
-    'Сегодня': 0,
-    'Завтра': 1,
-    'Послезавтра': 2,
-    'СЕГОДНЯ': 0,
-    'ЗАВТРА': 1,
-    'ПОСЛЕЗАВТРА': 2
+    'через неделю': 7
 }
 
 # Дни недели для парсинга
@@ -294,6 +492,31 @@ WEEKDAYS_PARSE = {
 }
 
 
+@lru_cache(maxsize=512)  # Больше, чем часовых поясов у пользователей на практике (всего в IANA ~600)
+def get_zoneinfo(name: str) -> ZoneInfo:
+    """Кэшированный объект часового пояса (ZoneInfo читает tzdata при создании)"""
+    return ZoneInfo(name)
+
+
+@lru_cache(maxsize=128)
+def _today_start(user_timezone: Optional[str], current_second: int) -> datetime:
+    """Начало текущих суток в часовом поясе пользователя"""
+    now = None
+    if user_timezone:
+        try:
+            now = datetime.now(get_zoneinfo(user_timezone))
+        except Exception:
+            pass
+    if now is None:
+        now = datetime.now()
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_today_start(user_timezone: Optional[str] = None) -> datetime:
+    """Начало текущих суток в часовом поясе пользователя (кэшируется в пределах одной секунды)"""
+    return _today_start(user_timezone, int(time.time()))
+
+
 def get_weekday(date_obj: datetime) -> str:
     """Получение дня недели на русском"""
     return WEEKDAYS[date_obj.weekday()]
@@ -304,7 +527,7 @@ def get_weekday_short(date_obj: datetime) -> str:
     return WEEKDAYS_SHORT[date_obj.weekday()]
 
 
-def get_main_keyboard():
+def _build_main_keyboard() -> ReplyKeyboardMarkup:
     """Создание основной клавиатуры с командами"""
     keyboard = [
         [
@@ -323,16 +546,54 @@ def get_main_keyboard():
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+# Клавиатура статична, поэтому создаем её один раз при загрузке модуля
+_MAIN_KEYBOARD = _build_main_keyboard()
+
+# Статичные inline-клавиатуры: подтверждение удаления расписания и меню редактирования без событий
+_CONFIRM_DELETE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Да", callback_data="confirm_delete_yes")],
+    [InlineKeyboardButton("Нет", callback_data="confirm_delete_no")]
+])
+_NO_EVENTS_EDIT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("управление категориями", callback_data="manage_categories")],
+    [InlineKeyboardButton("назад", callback_data="back_to_main")]
+])
+# Выбор типа повторения при добавлении события
+_REPEAT_TYPE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Одноразовое", callback_data="repeat_once")],
+    [InlineKeyboardButton("Ежедневное", callback_data="repeat_daily")],
+    [InlineKeyboardButton("Еженедельное", callback_data="repeat_weekly")]
+])
+# Меню управления категориями: из главного меню и из процесса добавления события
+_MANAGE_CATEGORIES_ACTIONS = [
+    [InlineKeyboardButton("➕ Добавить категорию", callback_data="category_add")],
+    [InlineKeyboardButton("✏️ Редактировать категорию", callback_data="category_edit_list")],
+    [InlineKeyboardButton("🗑️ Удалить категорию", callback_data="category_delete_list")],
+    [InlineKeyboardButton("➡️ Дальше", callback_data="categories_done")],
+]
+_MANAGE_CATEGORIES_KEYBOARD = InlineKeyboardMarkup(_MANAGE_CATEGORIES_ACTIONS + [
+    [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
+])
+_MANAGE_CATEGORIES_NEW_EVENT_KEYBOARD = InlineKeyboardMarkup(_MANAGE_CATEGORIES_ACTIONS + [
+    [InlineKeyboardButton("◀️ Назад к выбору категории", callback_data="back_to_category_selection")]
+])
+
+
+def get_main_keyboard() -> ReplyKeyboardMarkup:
+    """Основная клавиатура с командами"""
+    return _MAIN_KEYBOARD
+
+
 def format_date_natural(date_obj: datetime) -> str:
     """Форматирование даты в естественном формате (например, "18 января")"""
-    day = date_obj.day
-    month_names = {
-        1: 'января', 2: 'февраля', 3: 'марта', 4: 'апреля',
-        5: 'мая', 6: 'июня', 7: 'июля', 8: 'августа',
-        9: 'сентября', 10: 'октября', 11: 'ноября', 12: 'декабря'
-    }
-    month = month_names[date_obj.month]
-    return f"{day} {month}"
+    return f"{date_obj.day} {MONTH_NAMES_RU[date_obj.month]}"
+
+
+@lru_cache(maxsize=512)
+def _format_day_header(date_obj: date) -> str:
+    """Заголовок дня в списке событий: дата жирным, сокращенный день недели с маленькой буквы.
+    Кэшируется - одни и те же ближайшие дни отображаются при каждом показе расписания"""
+    return f"<b>{format_date_natural(date_obj)}</b>, {get_weekday_short(date_obj).lower()}\n"
 
 
 def parse_natural_date(date_str: str, user_timezone: Optional[str] = None) -> Optional[datetime]:
@@ -340,22 +601,14 @@ def parse_natural_date(date_str: str, user_timezone: Optional[str] = None) -> Op
     Учитывает часовой пояс пользователя для относительных дат"""
     date_str = date_str.strip().lower()
     
-    # Получаем текущее время в часовом поясе пользователя
-    if user_timezone:
-        try:
-            tz = ZoneInfo(user_timezone)
-            now = datetime.now(tz)
-            today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        except:
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    else:
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    # Получаем начало текущих суток в часовом поясе пользователя
+    today = get_today_start(user_timezone)
     
     today_weekday = today.weekday()  # 0 = понедельник, 6 = воскресенье
     
     # Проверка относительных дат (сегодня, завтра, послезавтра)
-    if date_str in RELATIVE_DATES:
-        days_offset = RELATIVE_DATES[date_str]
+    days_offset = RELATIVE_DATES.get(date_str)
+    if days_offset is not None:
         result = today + timedelta(days=days_offset)
         # Убираем timezone info для возврата naive datetime
         if result.tzinfo is not None:
@@ -363,77 +616,43 @@ def parse_natural_date(date_str: str, user_timezone: Optional[str] = None) -> Op
         return result
     
     # Проверка дней недели (понедельник, вторник и т.д.)
-    if date_str in WEEKDAYS_PARSE:
-        target_weekday = WEEKDAYS_PARSE[date_str]
-        # Вычисляем количество дней до ближайшего дня недели
-        days_ahead = target_weekday - today_weekday
-        # Если день недели уже прошел на этой неделе, берем следующий
-        if days_ahead < 0:
-            days_ahead += 7
-        # Если сегодня нужный день недели, возвращаем сегодня
-        if days_ahead == 0:
-            result = today
-        else:
-            result = today + timedelta(days=days_ahead)
+    target_weekday = WEEKDAYS_PARSE.get(date_str)
+    if target_weekday is not None:
+        # Дней до ближайшего такого дня недели: 0 - сегодня, прошедший на этой неделе - следующий
+        result = today + timedelta(days=(target_weekday - today_weekday) % 7)
         # Убираем timezone info для возврата naive datetime
         if result.tzinfo is not None:
             result = result.replace(tzinfo=None)
         return result
     
-    # Проверка формата "DD MM" (например, "19 01", "25 12")
     parts = date_str.split()
-    if len(parts) == 2:
-        try:
-            day = int(parts[0])
-            month = int(parts[1])
-            
-            # Проверяем, что это два числа (день и месяц)
-            if 1 <= month <= 12 and 1 <= day <= 31:
-                current_year = today.year
-                
-                # Создаем дату
-                try:
-                    date_obj = datetime(current_year, month, day)
-                    # Если дата уже прошла в этом году, берем следующий год
-                    if date_obj < today:
-                        date_obj = datetime(current_year + 1, month, day)
-                    return date_obj
-                except ValueError:
-                    return None
-        except ValueError:
-            pass
     
-    # Проверка формата "число месяц" (например, "17 января", "18 января")
-    if len(parts) == 2:
-        try:
-            day = int(parts[0])
-            month_name = parts[1].lower()
+    # Проверка форматов "DD MM" (например, "19 01") и "число месяц" (например, "17 января")
+    if len(parts) == 2 and parts[0].isdecimal():
+        day = int(parts[0])
+        month = int(parts[1]) if parts[1].isdecimal() else MONTHS_RU.get(parts[1])
+        
+        if month and 1 <= month <= 12 and 1 <= day <= 31:
+            current_year = today.year
+            # Сравниваем с naive datetime
+            today_naive = today.replace(tzinfo=None)
             
-            if month_name in MONTHS_RU:
-                month = MONTHS_RU[month_name]
-                current_year = today.year
-                
-                # Создаем дату
-                try:
-                    date_obj = datetime(current_year, month, day)
-                    # Сравниваем с naive datetime
-                    today_naive = today.replace(tzinfo=None) if today.tzinfo else today
-                    # Если дата уже прошла в этом году, берем следующий год
-                    if date_obj < today_naive:
-                        date_obj = datetime(current_year + 1, month, day)
-                    return date_obj
-                except ValueError:
-                    return None
-        except ValueError:
-            pass
+            # Создаем дату
+            try:
+                date_obj = datetime(current_year, month, day)
+                # Если дата уже прошла в этом году, берем следующий год
+                if date_obj < today_naive:
+                    date_obj = datetime(current_year + 1, month, day)
+                return date_obj
+            except ValueError:
+                return None
     
     # Проверка формата "через N дней" или "через неделю"
     if date_str.startswith('через'):
-        parts = date_str.split()
         if len(parts) >= 2:
             if parts[1] == 'неделю' or parts[1] == 'недели':
                 result = today + timedelta(days=7)
-            elif parts[1].isdigit():
+            elif parts[1].isdecimal():
                 if len(parts) >= 3 and (parts[2] == 'дня' or parts[2] == 'дней' or parts[2] == 'день'):
                     days = int(parts[1])
                     result = today + timedelta(days=days)
@@ -452,67 +671,240 @@ def parse_natural_date(date_str: str, user_timezone: Optional[str] = None) -> Op
     return None
 
 
+# Числовая дата: 25.12.2024, 25/12/24, 25-12, 2024-12-25 (разделитель внутри даты один и тот же)
+_NUMERIC_DATE_RE = re.compile(r'^(\d{1,4})([./-])(\d{1,2})(?:\2(\d{1,4}))?$')
+
+# Относительное время: "через час", "через полтора часа", "через 2 часа", "через 2,5 часа"
+_RELATIVE_TIME_RE = re.compile(r'^через\s+(?:(полтора)\s+часа|(\d+(?:[.,]\d+)?)\s+час(?:а|ов)?|час)$')
+
+
+def parse_numeric_date(date_str: str, today_naive: datetime) -> Optional[datetime]:
+    """Разбор числовой даты одним регулярным выражением вместо перебора форматов strptime.
+    Поддерживаются ДД.ММ.ГГГГ, ДД.ММ.ГГ, ДД.ММ и ГГГГ.ММ.ДД (разделители . / -; ГГ - только с . и /).
+    Дата без года - ближайшая будущая (в этом году или в следующем)"""
+    match = _NUMERIC_DATE_RE.match(date_str)
+    if not match:
+        return None
+    first, separator, month, last = match.groups()
+    try:
+        if len(first) == 4:
+            # ГГГГ.ММ.ДД
+            if last is None or len(last) > 2:
+                return None
+            return datetime(int(first), int(month), int(last))
+        if len(first) > 2:
+            return None
+        day, month = int(first), int(month)
+        if last is None:
+            date_obj = datetime(today_naive.year, month, day)
+            if date_obj < today_naive:
+                date_obj = datetime(today_naive.year + 1, month, day)
+            return date_obj
+        if len(last) == 4:
+            return datetime(int(last), month, day)
+        if len(last) == 2 and separator != '-':
+            # Двузначный год как в strptime %y: 69-99 -> 19xx, 00-68 -> 20xx
+            year = int(last)
+            return datetime(year + (1900 if year >= 69 else 2000), month, day)
+    except ValueError:
+        pass
+    return None
+
+
+REQUIRED_EVENT_FIELDS = ('id', 'title', 'date', 'time', 'category')
+
+
+_DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+_TIME_RE = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+# Время, введенное пользователем: часы и минуты могут быть без ведущего нуля ("9:05", "9:5")
+_INPUT_TIME_RE = re.compile(r'^([01]?\d|2[0-3]):([0-5]?\d)$')
+_DAYS_IN_MONTH = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _is_valid_date(date_str: str) -> bool:
+    """Проверка даты в формате YYYY-MM-DD"""
+    match = _DATE_RE.match(date_str)
+    if match is None:
+        # Нестандартная запись (например, без ведущих нулей) - проверяем через strptime
+        try:
+            datetime.strptime(date_str, '%Y-%m-%d')
+            return True
+        except ValueError:
+            return False
+    year, month, day = map(int, match.groups())
+    if not (1 <= month <= 12 and 1 <= day <= _DAYS_IN_MONTH[month]):
+        return False
+    # 29 февраля допустимо только в високосный год
+    return not (month == 2 and day == 29) or (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0))
+
+
+def _is_valid_time(time_str: str) -> bool:
+    """Проверка времени в формате HH:MM"""
+    if not isinstance(time_str, str):
+        return False
+    if _TIME_RE.match(time_str):
+        return True
+    # Старые записи вида "9:05" - проверяем через strptime
+    try:
+        datetime.strptime(time_str, '%H:%M')
+        return True
+    except ValueError:
+        return False
+
+
+def normalize_time_input(time_str: str) -> str:
+    """Приведение введенного времени Ч:М / ЧЧ:ММ к формату ЧЧ:ММ, ValueError при неверном формате"""
+    match = _INPUT_TIME_RE.match(time_str)
+    if not match:
+        raise ValueError(f"Неверный формат времени: {time_str}")
+    return f"{int(match.group(1)):02d}:{int(match.group(2)):02d}"
+
+
+def parse_event_date(date_str: str) -> date:
+    """Разбор даты события YYYY-MM-DD (strptime - только для нестандартных старых записей)"""
+    try:
+        return date.fromisoformat(date_str)
+    except ValueError:
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
+
+
+def parse_event_time(time_str: str) -> dtime:
+    """Разбор времени события HH:MM (strptime - только для старых записей вида "9:05")"""
+    try:
+        return dtime.fromisoformat(time_str)
+    except ValueError:
+        return datetime.strptime(time_str, '%H:%M').time()
+
+
 def validate_event(event: Dict) -> bool:
     """Валидация события перед сохранением"""
-    required_fields = ['id', 'title', 'date', 'time', 'category']
-    for field in required_fields:
+    for field in REQUIRED_EVENT_FIELDS:
         if field not in event:
             logger.error(f"❌ Событие не содержит обязательное поле: {field}")
             return False
     
     # Проверка формата даты
-    try:
-        datetime.strptime(event['date'], '%Y-%m-%d')
-    except ValueError:
-        logger.error(f"❌ Неверный формат даты: {event['date']}")
+    date_str = event['date']
+    if not (isinstance(date_str, str) and _is_valid_date(date_str)):
+        logger.error(f"❌ Неверный формат даты: {date_str}")
         return False
     
     # Проверка формата времени
-    try:
-        datetime.strptime(event['time'], '%H:%M')
-    except ValueError:
+    if not _is_valid_time(event['time']):
         logger.error(f"❌ Неверный формат времени: {event['time']}")
         return False
     
     return True
 
 
-@retry_on_error(max_retries=3, delay=0.5)
-def load_data() -> Dict[str, List[Dict]]:
-    """Загрузка данных из файла с retry механизмом"""
-    if os.path.exists(DATA_FILE):
+def _load_json(file_path: str, expected_type: type = dict) -> Any:
+    """Загрузка JSON из файла (словарь, для файлов событий пользователей - список);
+    при повреждении файла восстанавливаем его из backup, который пишет atomic_write"""
+    if not os.path.exists(file_path):
+        return expected_type()
+    try:
+        with open(file_path, 'rb') as f:
+            data = json_loads(f.read())
+        return data if isinstance(data, expected_type) else expected_type()
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ Ошибка парсинга JSON в {file_path}: {e}")
+    except Exception as e:
+        logger.error(f"❌ Ошибка при загрузке {file_path}: {e}")
+        return expected_type()
+    
+    # Пытаемся восстановить из backup
+    backup_path = f"{file_path}.bak"
+    if os.path.exists(backup_path):
         try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Валидация загруженных данных
-                if isinstance(data, dict):
-                    for user_id, events in data.items():
-                        if isinstance(events, list):
-                            data[user_id] = [e for e in events if validate_event(e)]
-                    return data
-                return {}
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Ошибка парсинга JSON в {DATA_FILE}: {e}")
-            # Пытаемся восстановить из backup
-            backup_path = f"{DATA_FILE}.bak"
-            if os.path.exists(backup_path):
-                try:
-                    logger.info(f"🔄 Попытка восстановления из backup: {backup_path}")
-                    shutil.copy2(backup_path, DATA_FILE)
-                    with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-                except:
-                    pass
-            return {}
+            logger.info(f"🔄 Попытка восстановления из backup: {backup_path}")
+            shutil.copy2(backup_path, file_path)
+            with open(file_path, 'rb') as f:
+                data = json_loads(f.read())
+            return data if isinstance(data, expected_type) else expected_type()
         except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке данных: {e}")
-            return {}
-    return {}
+            logger.error(f"❌ Не удалось восстановить {file_path} из backup: {e}")
+    else:
+        logger.warning(f"⚠️  Backup для {file_path} не найден, данные файла не загружены")
+    return expected_type()
+
+
+_data_cache: Optional[Dict[str, List[Dict]]] = None
+
+
+def _user_events_path(user_id_str: str) -> str:
+    """Путь к файлу событий пользователя"""
+    return os.path.join(EVENTS_DIR, f"{user_id_str}.json")
+
+
+def _load_events_dir() -> Dict[str, List[Dict]]:
+    """Чтение событий всех пользователей из EVENTS_DIR (backup и временные файлы пропускаются)"""
+    data = {}
+    for name in os.listdir(EVENTS_DIR):
+        if not name.endswith('.json'):
+            continue
+        data[name[:-len('.json')]] = _load_json(os.path.join(EVENTS_DIR, name), list)
+    return data
+
+
+def _migrate_data_file() -> Dict[str, List[Dict]]:
+    """Перенос событий из общего DATA_FILE в файлы по пользователям (однократно).
+    Файлы пишутся во временную папку, которая переименовывается в EVENTS_DIR только в конце:
+    load_data считает перенос выполненным, если EVENTS_DIR существует, поэтому при сбое на середине
+    перенос просто повторится при следующем запуске. DATA_FILE не удаляется и остается копией данных"""
+    data = _load_json(DATA_FILE)
+    temp_dir = f"{EVENTS_DIR}.tmp"
+    # Остатки прерванного переноса
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    for user_id_str, events in data.items():
+        if isinstance(events, list) and events:
+            with open(os.path.join(temp_dir, f"{user_id_str}.json"), 'wb') as f:
+                _dump_json(events, f, pretty=True)
+                f.flush()
+                os.fsync(f.fileno())
+    os.replace(temp_dir, EVENTS_DIR)
+    if data:
+        logger.info(f"📦 События {len(data)} пользователей перенесены из {DATA_FILE} в {EVENTS_DIR}/")
+    return data
+
+
+def load_data() -> Dict[str, List[Dict]]:
+    """События всех пользователей из кэша в памяти (с диска читаются один раз).
+    События валидируются при сохранении, поэтому данным на диске доверяем"""
+    global _data_cache
+    if _data_cache is None:
+        if os.path.isdir(EVENTS_DIR):
+            _data_cache = _load_events_dir()
+        else:
+            _data_cache = _migrate_data_file()
+        # Старые записи без event_ts_utc получают его один раз и сохраняются с ним
+        for user_id_str, events in _data_cache.items():
+            if any('event_ts_utc' not in e for e in events) and stamp_user_events(user_id_str, events):
+                _save_user_events_file(user_id_str)
+    return _data_cache
+
+
+def _save_user_events_file(user_id_str: str):
+    """Планирование записи файла событий одного пользователя (остальные файлы не трогаем)"""
+    # Все изменения событий проходят через эту функцию - здесь же сбрасываем индексы событий
+    _sorted_events_cache.pop(user_id_str, None)
+    _events_by_id_cache.pop(user_id_str, None)
+    schedule_write(_user_events_path(user_id_str), load_data().get(user_id_str, []))
+
+
+def save_user_events(user_id: str, events: List[Dict]):
+    """Замена всех событий пользователя с валидацией; записывается только файл этого пользователя"""
+    user_id_str = str(user_id)
+    load_data()[user_id_str] = [e for e in events if validate_event(e)]
+    stamp_user_events(user_id_str, load_data()[user_id_str])
+    _save_user_events_file(user_id_str)
+    mark_reminders_dirty(user_id_str)
 
 
-@retry_on_error(max_retries=3, delay=0.5)
 def save_data(data: Dict[str, List[Dict]]):
-    """Сохранение данных в файл с атомарной записью и backup"""
+    """Сохранение событий всех пользователей: обновляем кэш и планируем отложенную атомарную запись с backup.
+    Перезаписывает файлы всех пользователей - для изменений одного пользователя есть save_user_events"""
+    global _data_cache
     # Валидация данных перед сохранением
     validated_data = {}
     for user_id, events in data.items():
@@ -520,132 +912,214 @@ def save_data(data: Dict[str, List[Dict]]):
             validated_data[user_id] = [e for e in events if validate_event(e)]
         else:
             validated_data[user_id] = []
+        stamp_user_events(user_id, validated_data[user_id])
     
-    atomic_write(DATA_FILE, validated_data, backup=True)
+    # Пользователи, которых нет в новых данных, остаются с пустым списком событий
+    for user_id in load_data():
+        if user_id not in validated_data:
+            schedule_write(_user_events_path(user_id), [])
+    
+    _data_cache = validated_data
+    _sorted_events_cache.clear()
+    _events_by_id_cache.clear()
+    for user_id in validated_data:
+        _save_user_events_file(user_id)
 
 
-@retry_on_error(max_retries=3, delay=0.5)
 def load_messages() -> Dict[str, List[int]]:
-    """Загрузка ID сообщений пользователей с retry механизмом"""
-    if os.path.exists(MESSAGES_FILE):
-        try:
-            with open(MESSAGES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Ошибка парсинга JSON в {MESSAGES_FILE}: {e}")
-            backup_path = f"{MESSAGES_FILE}.bak"
-            if os.path.exists(backup_path):
+    """Загрузка ID сообщений пользователей"""
+    return _load_json(MESSAGES_FILE)
+
+
+_messages_cache: Optional[Dict[str, List[int]]] = None
+
+# Журнал дозаписи: новые ID сообщений дописываются строкой [user_id, message_id],
+# а полный снимок MESSAGES_FILE перезаписывается только при сжатии журнала
+_messages_log_lock = threading.Lock()
+_messages_log = None
+_messages_log_base = 0  # Сколько байт уже отрезано от начала журнала
+_messages_log_appends = 0
+_messages_log_compacted_at = time.monotonic()
+
+
+def _replay_messages_log(messages_data: Dict[str, List[int]]):
+    """Применение журнала дозаписи к загруженному снимку ID сообщений"""
+    if not os.path.exists(MESSAGES_LOG_FILE):
+        return
+    try:
+        with open(MESSAGES_LOG_FILE, 'rb') as f:
+            for line in f:
                 try:
-                    shutil.copy2(backup_path, MESSAGES_FILE)
-                    with open(MESSAGES_FILE, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-                except:
-                    pass
-            return {}
-        except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке сообщений: {e}")
-            return {}
-    return {}
+                    user_id_str, message_id = json_loads(line)
+                except (ValueError, TypeError):
+                    # Оборванная последняя строка после аварийного завершения
+                    continue
+                user_messages = messages_data.setdefault(user_id_str, [])
+                if message_id not in user_messages:
+                    user_messages.append(message_id)
+                    if len(user_messages) > 50:
+                        del user_messages[:-50]
+    except Exception as e:
+        logger.error(f"❌ Ошибка при чтении журнала {MESSAGES_LOG_FILE}: {e}")
+
+
+def _append_messages_log(user_id_str: str, message_id: int):
+    """Дозапись одного ID сообщения в журнал"""
+    global _messages_log
+    with _messages_log_lock:
+        if _messages_log is None:
+            _messages_log = open(MESSAGES_LOG_FILE, 'a', encoding='utf-8')
+        _messages_log.write(json.dumps([user_id_str, message_id]) + '\n')
+        _messages_log.flush()
+
+
+def _messages_log_checkpoint() -> Callable:
+    """Фиксация текущего конца журнала в момент снятия снимка сообщений.
+    Возвращает функцию, которая после записи снимка отрезает покрытую им часть журнала"""
+    with _messages_log_lock:
+        try:
+            end = _messages_log_base + os.path.getsize(MESSAGES_LOG_FILE)
+        except OSError:
+            end = _messages_log_base
+    return lambda: _trim_messages_log(end)
+
+
+def _trim_messages_log(end: int):
+    """Удаление из журнала записей, уже вошедших в снимок MESSAGES_FILE (вызывается потоком записи)"""
+    global _messages_log, _messages_log_base
+    with _messages_log_lock:
+        size = end - _messages_log_base
+        if size <= 0:
+            return
+        try:
+            with open(MESSAGES_LOG_FILE, 'rb') as f:
+                f.seek(size)
+                tail = f.read()
+        except FileNotFoundError:
+            return
+        if _messages_log is not None:
+            _messages_log.close()
+            _messages_log = None
+        if tail:
+            temp_path = f"{MESSAGES_LOG_FILE}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(tail)
+            os.replace(temp_path, MESSAGES_LOG_FILE)
+        else:
+            os.remove(MESSAGES_LOG_FILE)
+        _messages_log_base = end
+
+
+def get_messages_data() -> Dict[str, List[int]]:
+    """ID сообщений бота из кэша в памяти (с диска читаются один раз)"""
+    global _messages_cache
+    if _messages_cache is None:
+        _messages_cache = load_messages()
+        _replay_messages_log(_messages_cache)
+    return _messages_cache
 
 
-@retry_on_error(max_retries=3, delay=0.5)
 def save_messages(messages_data: Dict[str, List[int]]):
-    """Сохранение ID сообщений с атомарной записью"""
-    atomic_write(MESSAGES_FILE, messages_data, backup=True)
+    """Сохранение ID сообщений: обновляем кэш и планируем отложенную запись полного снимка"""
+    global _messages_cache, _messages_log_appends, _messages_log_compacted_at
+    _messages_cache = messages_data
+    _messages_log_appends = 0
+    _messages_log_compacted_at = time.monotonic()
+    schedule_write(MESSAGES_FILE, messages_data)
 
 
 def add_message_id(user_id: str, message_id: int):
-    """Добавление ID сообщения бота для пользователя"""
-    messages_data = load_messages()
+    """Добавление ID сообщения бота для пользователя (дозапись в журнал без перезаписи всего файла)"""
+    global _messages_log_appends
+    messages_data = get_messages_data()
     user_id_str = str(user_id)
-    if user_id_str not in messages_data:
-        messages_data[user_id_str] = []
-    messages_data[user_id_str].append(message_id)
+    user_messages = messages_data.setdefault(user_id_str, [])
+    user_messages.append(message_id)
     # Храним только последние 50 сообщений для каждого пользователя
-    messages_data[user_id_str] = messages_data[user_id_str][-50:]
-    save_messages(messages_data)
+    if len(user_messages) > 50:
+        del user_messages[:-50]
+    _append_messages_log(user_id_str, message_id)
+    _messages_log_appends += 1
+    # Периодически сжимаем журнал в полный снимок
+    if (_messages_log_appends >= MESSAGES_LOG_COMPACT_EVERY
+            or time.monotonic() - _messages_log_compacted_at >= MESSAGES_LOG_COMPACT_INTERVAL):
+        save_messages(messages_data)
 
 
-@retry_on_error(max_retries=3, delay=0.5)
 def load_user_sent_messages() -> Dict[str, List[int]]:
-    """Загрузка ID сообщений пользователя с retry механизмом"""
-    if os.path.exists(USER_MESSAGES_FILE):
-        try:
-            with open(USER_MESSAGES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Ошибка парсинга JSON в {USER_MESSAGES_FILE}: {e}")
-            backup_path = f"{USER_MESSAGES_FILE}.bak"
-            if os.path.exists(backup_path):
-                try:
-                    shutil.copy2(backup_path, USER_MESSAGES_FILE)
-                    with open(USER_MESSAGES_FILE, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-                except:
-                    pass
-            return {}
-        except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке сообщений пользователя: {e}")
-            return {}
-    return {}
+    """Загрузка ID сообщений пользователя"""
+    return _load_json(USER_MESSAGES_FILE)
+
+
+_user_sent_messages_cache: Optional[Dict[str, List[int]]] = None
+
+
+def get_user_sent_messages_data() -> Dict[str, List[int]]:
+    """ID сообщений пользователей из кэша в памяти (с диска читаются один раз)"""
+    global _user_sent_messages_cache
+    if _user_sent_messages_cache is None:
+        _user_sent_messages_cache = load_user_sent_messages()
+    return _user_sent_messages_cache
 
 
-@retry_on_error(max_retries=3, delay=0.5)
 def save_user_sent_messages(messages_data: Dict[str, List[int]]):
-    """Сохранение ID сообщений пользователя с атомарной записью"""
-    atomic_write(USER_MESSAGES_FILE, messages_data, backup=True)
+    """Сохранение ID сообщений пользователя: обновляем кэш и планируем отложенную запись"""
+    global _user_sent_messages_cache
+    _user_sent_messages_cache = messages_data
+    schedule_write(USER_MESSAGES_FILE, messages_data)
 
 
 def add_user_message_id(user_id: str, message_id: int):
     """Добавление ID сообщения пользователя"""
-    messages_data = load_user_sent_messages()
-    user_id_str = str(user_id)
-    if user_id_str not in messages_data:
-        messages_data[user_id_str] = []
-    messages_data[user_id_str].append(message_id)
+    messages_data = get_user_sent_messages_data()
+    user_messages = messages_data.setdefault(str(user_id), [])
+    user_messages.append(message_id)
     # Храним только последние 50 сообщений для каждого пользователя
-    messages_data[user_id_str] = messages_data[user_id_str][-50:]
+    if len(user_messages) > 50:
+        del user_messages[:-50]
     save_user_sent_messages(messages_data)
 
 
-@retry_on_error(max_retries=3, delay=0.5)
 def load_user_categories() -> Dict[str, Dict[str, str]]:
-    """Загрузка категорий пользователей с retry механизмом"""
-    if os.path.exists(CATEGORIES_FILE):
-        try:
-            with open(CATEGORIES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Ошибка парсинга JSON в {CATEGORIES_FILE}: {e}")
-            return {}
-        except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке категорий: {e}")
-            return {}
-    return {}
+    """Загрузка категорий пользователей"""
+    return _load_json(CATEGORIES_FILE)
+
+
+_categories_cache: Optional[Dict[str, Dict[str, str]]] = None
+
+
+def get_categories_data() -> Dict[str, Dict[str, str]]:
+    """Категории всех пользователей из кэша в памяти (с диска читаются один раз)"""
+    global _categories_cache
+    if _categories_cache is None:
+        _categories_cache = load_user_categories()
+    return _categories_cache
 
 
-@retry_on_error(max_retries=3, delay=0.5)
 def save_user_categories(categories_data: Dict[str, Dict[str, str]]):
-    """Сохранение категорий пользователей с атомарной записью"""
-    atomic_write(CATEGORIES_FILE, categories_data, backup=True)
+    """Сохранение категорий пользователей: обновляем кэш и планируем отложенную запись"""
+    global _categories_cache
+    _categories_cache = categories_data
+    schedule_write(CATEGORIES_FILE, categories_data)
 
 
 def get_user_categories(user_id: str) -> Dict[str, str]:
     """Получение категорий пользователя"""
-    categories_data = load_user_categories()
+    categories_data = get_categories_data()
     user_id_str = str(user_id)
     
     # Если у пользователя нет категорий, создаем стандартную
-    if user_id_str not in categories_data or not categories_data[user_id_str]:
-        categories_data[user_id_str] = DEFAULT_CATEGORIES.copy()
+    user_categories = categories_data.get(user_id_str)
+    if not user_categories:
+        user_categories = categories_data[user_id_str] = DEFAULT_CATEGORIES.copy()
         save_user_categories(categories_data)
     
-    return categories_data.get(user_id_str, DEFAULT_CATEGORIES.copy())
+    return user_categories
 
 
 def add_user_category(user_id: str, category_id: str, category_name: str):
     """Добавление категории пользователю"""
-    categories_data = load_user_categories()
+    categories_data = get_categories_data()
     user_id_str = str(user_id)
     
     if user_id_str not in categories_data:
@@ -657,7 +1131,7 @@ def add_user_category(user_id: str, category_id: str, category_name: str):
 
 def delete_user_category(user_id: str, category_id: str) -> bool:
     """Удаление категории пользователя"""
-    categories_data = load_user_categories()
+    categories_data = get_categories_data()
     user_id_str = str(user_id)
     
     if user_id_str not in categories_data:
@@ -676,7 +1150,7 @@ def delete_user_category(user_id: str, category_id: str) -> bool:
 
 def update_user_category(user_id: str, category_id: str, new_name: str):
     """Обновление названия категории"""
-    categories_data = load_user_categories()
+    categories_data = get_categories_data()
     user_id_str = str(user_id)
     
     if user_id_str not in categories_data:
@@ -696,61 +1170,50 @@ def generate_category_id() -> str:
 
 
 # Функции для работы с настройками пользователя (город и часовой пояс)
-@retry_on_error(max_retries=3, delay=0.5)
 def load_user_settings() -> Dict[str, Dict[str, str]]:
-    """Загрузка настроек пользователей с retry механизмом"""
-    if os.path.exists(USER_SETTINGS_FILE):
-        try:
-            with open(USER_SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Ошибка парсинга JSON в {USER_SETTINGS_FILE}: {e}")
-            backup_path = f"{USER_SETTINGS_FILE}.bak"
-            if os.path.exists(backup_path):
-                try:
-                    shutil.copy2(backup_path, USER_SETTINGS_FILE)
-                    with open(USER_SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-                except:
-                    pass
-            return {}
-        except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке настроек: {e}")
-            return {}
-    return {}
+    """Загрузка настроек пользователей"""
+    return _load_json(USER_SETTINGS_FILE)
+
+
+_settings_cache: Optional[Dict[str, Dict[str, str]]] = None
+
+
+def get_settings_data() -> Dict[str, Dict[str, str]]:
+    """Настройки всех пользователей из кэша в памяти (с диска читаются один раз)"""
+    global _settings_cache
+    if _settings_cache is None:
+        _settings_cache = load_user_settings()
+    return _settings_cache
 
 
-@retry_on_error(max_retries=3, delay=0.5)
 def save_user_settings(settings_data: Dict[str, Dict[str, str]]):
-    """Сохранение настроек пользователей с атомарной записью"""
-    atomic_write(USER_SETTINGS_FILE, settings_data, backup=True)
+    """Сохранение настроек пользователей: обновляем кэш и планируем отложенную запись"""
+    global _settings_cache
+    _settings_cache = settings_data
+    schedule_write(USER_SETTINGS_FILE, settings_data)
 
 
 def get_user_settings(user_id: str) -> Dict[str, str]:
     """Получение настроек пользователя"""
-    settings_data = load_user_settings()
-    user_id_str = str(user_id)
-    return settings_data.get(user_id_str, {})
+    return get_settings_data().get(str(user_id), {})
 
 
 def set_user_city(user_id: str, city: str):
     """Установка города пользователя"""
-    settings_data = load_user_settings()
-    user_id_str = str(user_id)
-    if user_id_str not in settings_data:
-        settings_data[user_id_str] = {}
-    settings_data[user_id_str]['city'] = city
+    settings_data = get_settings_data()
+    settings_data.setdefault(str(user_id), {})['city'] = city
     save_user_settings(settings_data)
 
 
 def set_user_timezone(user_id: str, timezone: str):
     """Установка часового пояса пользователя"""
-    settings_data = load_user_settings()
-    user_id_str = str(user_id)
-    if user_id_str not in settings_data:
-        settings_data[user_id_str] = {}
-    settings_data[user_id_str]['timezone'] = timezone
+    settings_data = get_settings_data()
+    settings_data.setdefault(str(user_id), {})['timezone'] = timezone
     save_user_settings(settings_data)
+    # UTC время событий и напоминаний пользователя зависит от часового пояса
+    if stamp_user_events(str(user_id)):
+        _save_user_events_file(str(user_id))
+    mark_reminders_dirty(user_id)
 
 
 def get_user_timezone(user_id: str) -> Optional[str]:
@@ -809,7 +1272,7 @@ TIMEZONES = {
 }
 
 
-def get_timezone_keyboard() -> InlineKeyboardMarkup:
+def _build_timezone_keyboard() -> InlineKeyboardMarkup:
     """Создание клавиатуры для выбора часового пояса"""
     keyboard = []
     # Группируем по 2 кнопки в ряд
@@ -824,28 +1287,106 @@ def get_timezone_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(keyboard)
 
 
-def get_timezone_by_city(city_name: str) -> Optional[str]:
-    """Определение часового пояса по названию города"""
-    if not GEOCODING_AVAILABLE:
-        logger.warning("⚠️  Библиотеки для определения часового пояса не установлены")
+_TIMEZONE_KEYBOARD = _build_timezone_keyboard()
+
+
+def get_timezone_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура для выбора часового пояса"""
+    return _TIMEZONE_KEYBOARD
+
+
+# Геокодер и TimezoneFinder создаются один раз (TimezoneFinder загружает полигоны часовых поясов с диска).
+# С tzfpy TimezoneFinder не нужен - get_tz работает без состояния
+_geolocator = None
+_timezone_finder = None
+# Поиск города идет в потоках (asyncio.to_thread): блокировка защищает создание общих экземпляров
+# и запросы к TimezoneFinder, который читает общие файлы данных и не рассчитан на несколько потоков
+_geocoding_lock = threading.Lock()
+
+
+def get_geocoding_tools():
+    """Общие экземпляры Nominatim и TimezoneFinder (None, если используется tzfpy)"""
+    global _geolocator, _timezone_finder
+    if _geolocator is not None and (_timezone_finder is not None or get_tz is not None):
+        return _geolocator, _timezone_finder
+    with _geocoding_lock:
+        if _geolocator is None:
+            _geolocator = Nominatim(user_agent="telegram_schedule_bot")
+        if _timezone_finder is None and get_tz is None:
+            _timezone_finder = TimezoneFinder()
+    return _geolocator, _timezone_finder
+
+
+def _timezone_at(lat: float, lng: float) -> Optional[str]:
+    """Часовой пояс по координатам: tzfpy, если установлен, иначе timezonefinder"""
+    if get_tz is not None:
+        return get_tz(lng, lat) or None
+    _, tf = get_geocoding_tools()
+    with _geocoding_lock:
+        return tf.timezone_at(lat=lat, lng=lng)
+
+
+_city_timezones_cache: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+def get_city_timezones_data() -> Dict[str, Dict[str, Any]]:
+    """Кэш "город -> часовой пояс" в памяти (с диска читается один раз)"""
+    global _city_timezones_cache
+    if _city_timezones_cache is None:
+        _city_timezones_cache = _load_json(CITY_TIMEZONES_FILE)
+    return _city_timezones_cache
+
+
+def _lookup_timezone_by_city(city_key: str) -> Optional[str]:
+    """Запрос координат города и часового пояса к Nominatim (блокирующий, выполняется в отдельном потоке)"""
+    geolocator, _ = get_geocoding_tools()
+    # Используем geopy для получения координат города
+    location = geolocator.geocode(city_key, timeout=10, language='ru')
+    if location and hasattr(location, 'latitude') and hasattr(location, 'longitude'):
+        # Определяем часовой пояс по координатам
+        return _timezone_at(location.latitude, location.longitude)
+    return None
+
+
+# Запросы к Nominatim, выполняющиеся сейчас: одинаковые города ждут один общий запрос
+_city_lookups: Dict[str, asyncio.Future] = {}
+
+
+async def get_timezone_by_city(city_name: str) -> Optional[str]:
+    """Определение часового пояса по названию города (с постоянным кэшем в CITY_TIMEZONES_FILE).
+    Попадание в кэш обходится без потоков; запрос к Nominatim не блокирует event loop"""
+    if not city_name or not city_name.strip():
         return None
     
-    if not city_name or not city_name.strip():
+    # "Нижний  Новгород " и "нижний новгород" - один ключ кэша
+    city_key = ' '.join(city_name.split()).casefold()
+    cache = get_city_timezones_data()
+    cached = cache.get(city_key)
+    if cached and (cached.get('timezone') or time.time() - cached.get('checked_at', 0) < CITY_NOT_FOUND_TTL):
+        return cached.get('timezone')
+    
+    if not GEOCODING_AVAILABLE:
+        logger.warning("⚠️  Библиотеки для определения часового пояса не установлены")
         return None
     
     try:
-        # Используем geopy для получения координат города
-        geolocator = Nominatim(user_agent="telegram_schedule_bot")
-        location = geolocator.geocode(city_name.strip(), timeout=10, language='ru')
-        
-        if location and hasattr(location, 'latitude') and hasattr(location, 'longitude'):
-            # Используем timezonefinder для определения часового пояса по координатам
-            tf = TimezoneFinder()
-            timezone_name = tf.timezone_at(lat=location.latitude, lng=location.longitude)
-            
-            if timezone_name:
-                logger.info(f"✅ Определен часовой пояс {timezone_name} для города {city_name}")
-                return timezone_name
+        # Ошибки сети не кэшируются - исключение уходит в обработчик ниже
+        lookup = _city_lookups.get(city_key)
+        if lookup is None:
+            lookup = asyncio.ensure_future(asyncio.to_thread(_lookup_timezone_by_city, city_key))
+            _city_lookups[city_key] = lookup
+            lookup.add_done_callback(lambda _: _city_lookups.pop(city_key, None))
+        # shield: отмена одного ожидающего обработчика не отменяет общий запрос
+        timezone_name = await asyncio.shield(lookup)
+        cache.pop(city_key, None)
+        if len(cache) >= CITY_TIMEZONES_MAX:
+            # Вытесняем самую старую запись
+            del cache[next(iter(cache))]
+        cache[city_key] = {'timezone': timezone_name, 'checked_at': int(time.time())}
+        schedule_write(CITY_TIMEZONES_FILE, cache)
+        if timezone_name:
+            logger.info(f"✅ Определен часовой пояс {timezone_name} для города {city_name}")
+            return timezone_name
         logger.warning(f"⚠️  Не удалось найти координаты для города {city_name}")
         return None
     except Exception as e:
@@ -853,6 +1394,12 @@ def get_timezone_by_city(city_name: str) -> Optional[str]:
         return None
 
 
+# Команды и кнопки, которые не являются названием города
+_NOT_CITY_TEXTS = frozenset({'что завтра?', 'завтра', 'что сегодня?', 'сегодня', 'моё расписание',
+                             '➕', '✏️', '🙈', 'skip', '/skip', 'отмена', 'cancel'})
+_TIME_LIKE_RE = re.compile(r'^\d{1,2}:\d{1,2}$')
+
+
 def is_likely_city(text: str) -> bool:
     """Проверка, похоже ли сообщение на название города"""
     text = text.strip()
@@ -861,86 +1408,170 @@ def is_likely_city(text: str) -> bool:
         return False
     
     # Исключаем команды и кнопки
-    excluded = ['что завтра?', 'завтра', 'что сегодня?', 'сегодня', 'моё расписание', 
-                '➕', '✏️', '🙈', 'skip', '/skip', 'отмена', 'cancel']
-    if text.lower() in excluded:
+    if text.casefold() in _NOT_CITY_TEXTS:
         return False
     
-    # Проверяем, что это не число и не дата
-    if text.isdigit():
+    # Проверяем, что это не число и не время (формат HH:MM)
+    if text.isdigit() or _TIME_LIKE_RE.match(text):
         return False
     
-    # Проверяем, что это не время (формат HH:MM)
-    if ':' in text and len(text.split(':')) == 2:
-        try:
-            parts = text.split(':')
-            if len(parts[0]) <= 2 and len(parts[1]) <= 2:
-                int(parts[0])
-                int(parts[1])
-                return False
-        except:
-            pass
+    # Если текст содержит буквы (кириллица или латиница), возможно это город.
+    # Название города почти всегда начинается с буквы - посимвольный перебор только для остальных случаев
+    return text[0].isalpha() or any(c.isalpha() for c in text)
+
+
+class TokenBucket:
+    """Ограничитель скорости "ведро токенов": rate токенов в секунду, не больше burst подряд"""
     
-    # Если текст состоит в основном из букв (кириллица или латиница), возможно это город
-    if any(c.isalpha() for c in text):
-        return True
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
     
-    return False
+    def _refill(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+    
+    def is_idle(self) -> bool:
+        """Ведро полное - его можно удалить без потери ограничения"""
+        return self._refill() >= self.burst
+    
+    async def acquire(self):
+        """Ожидание токена; запросы обслуживаются по очереди"""
+        async with self._lock:
+            while self._refill() < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+            self.tokens -= 1
+
+
+class BucketRateLimiter(BaseRateLimiter):
+    """Ограничение запросов к Bot API до их отправки, чтобы не получать RetryAfter:
+    общее ведро на все запросы и отдельное ведро на отправку сообщений в каждый чат"""
+    
+    def __init__(self):
+        self._global_bucket = TokenBucket(GLOBAL_RATE_LIMIT, GLOBAL_RATE_LIMIT)
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Ведра чатов, в которые давно ничего не отправляли, больше не нужны
+            if len(self._chat_buckets) >= 1024:
+                for idle_chat_id in [key for key, value in self._chat_buckets.items() if value.is_idle()]:
+                    del self._chat_buckets[idle_chat_id]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(CHAT_RATE_LIMIT, CHAT_RATE_BURST)
+        return bucket
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is not None and endpoint.startswith('send'):
+            await self._chat_bucket(chat_id).acquire()
+        await self._global_bucket.acquire()
+        return await callback(*args, **kwargs)
 
 
-async def delete_user_sent_messages(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id: int, pinned_message_id: Optional[int] = None) -> int:
-    """Попытка удаления сообщений пользователя (работает только в группах, если бот - админ) с улучшенной обработкой ошибок"""
+# Ссылки на фоновые задачи, чтобы сборщик мусора не отменил их до завершения
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def _safe_delete(message) -> None:
+    """Удаление сообщения без ошибок (сообщение уже удалено или нет прав)"""
     try:
-        messages_data = load_user_sent_messages()
-        user_id_str = str(user_id)
-        deleted_count = 0
-        
-        if user_id_str in messages_data:
-            message_ids = messages_data[user_id_str]
-            # Пытаемся удалить сообщения пользователя
-            # ВАЖНО: Это работает только в группах, если бот является администратором
-            # В личных чатах это не сработает из-за ограничений Telegram Bot API
-            remaining_messages = []
-            for msg_id in message_ids:
-                # Пропускаем закрепленное сообщение
-                if pinned_message_id and msg_id == pinned_message_id:
-                    remaining_messages.append(msg_id)
-                    continue
+        await message.delete()
+    except Exception:
+        pass
+
+
+def run_in_background(coro) -> None:
+    """Запуск корутины фоновой задачей, не дожидаясь ее завершения"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def delete_message_in_background(message) -> None:
+    """Удаление сообщения в фоне, не дожидаясь ответа Telegram"""
+    run_in_background(_safe_delete(message))
+
+
+async def _delete_single_messages(bot, chat_id: int, message_ids: List[int]) -> int:
+    """Поштучное удаление сообщений (запасной вариант для пачки, которую Telegram отклонил целиком).
+    Запросы идут параллельно, не более DELETE_SINGLE_CONCURRENCY одновременно"""
+    semaphore = asyncio.Semaphore(DELETE_SINGLE_CONCURRENCY)
+    
+    async def delete_one(msg_id: int) -> bool:
+        async with semaphore:
+            while True:
                 try:
-                    await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
-                    deleted_count += 1
-                    # Небольшая задержка между удалениями (50ms)
-                    await asyncio.sleep(0.05)
+                    await bot.delete_message(chat_id=chat_id, message_id=msg_id)
+                    return True
                 except RetryAfter as e:
-                    logger.warning(f"⚠️  Rate limit при удалении сообщений пользователя. Ждем {e.retry_after}с")
+                    # Ждем только при ошибке лимита и повторяем удаление
+                    logger.warning(f"⚠️  Rate limit при удалении сообщений. Ждем {e.retry_after}с")
                     await asyncio.sleep(e.retry_after)
-                except (TimedOut, NetworkError) as e:
-                    logger.warning(f"⚠️  Сетевая ошибка при удалении сообщения пользователя {msg_id}: {e}")
-                    continue
                 except Exception:
                     # Игнорируем ошибки (сообщение уже удалено, недоступно или нет прав)
-                    pass
-            
-            # Сохраняем только закрепленное сообщение (если есть)
-            messages_data[user_id_str] = remaining_messages
-            save_user_sent_messages(messages_data)
-        
-        return deleted_count
-    except Exception as e:
-        logger.error(f"❌ Ошибка при удалении сообщений пользователя {user_id}: {e}", exc_info=True)
-        return 0
+                    return False
+    
+    results = await asyncio.gather(*(delete_one(msg_id) for msg_id in message_ids))
+    return sum(results)
+
+
+async def _delete_chunk(bot, chat_id: int, chunk: List[int]) -> int:
+    """Удаление пачки до DELETE_MESSAGES_BATCH сообщений одним запросом deleteMessages"""
+    while True:
+        try:
+            await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+            # Ненайденные сообщения Telegram пропускает без ошибки
+            return len(chunk)
+        except RetryAfter as e:
+            logger.warning(f"⚠️  Rate limit при удалении сообщений. Ждем {e.retry_after}с")
+            await asyncio.sleep(e.retry_after)
+        except BadRequest as e:
+            logger.debug(f"Пачка сообщений не удалена целиком ({e}), удаляем по одному")
+            return await _delete_single_messages(bot, chat_id, chunk)
+        except (TimedOut, NetworkError) as e:
+            logger.warning(f"⚠️  Сетевая ошибка при удалении сообщений: {e}")
+            return 0
+        except Exception:
+            return 0
+
+
+async def delete_messages_bulk(bot, chat_id: int, message_ids: List[int]) -> int:
+    """Удаление сообщений пачками через deleteMessages, возвращает количество удаленных.
+    Пачки отправляются параллельно, но не более DELETE_MESSAGES_CONCURRENCY запросов одновременно"""
+    chunks = [message_ids[i:i + DELETE_MESSAGES_BATCH] for i in range(0, len(message_ids), DELETE_MESSAGES_BATCH)]
+    if len(chunks) <= 1:
+        return await _delete_chunk(bot, chat_id, chunks[0]) if chunks else 0
+    
+    semaphore = asyncio.Semaphore(DELETE_MESSAGES_CONCURRENCY)
+    
+    async def delete_chunk_limited(chunk: List[int]) -> int:
+        async with semaphore:
+            return await _delete_chunk(bot, chat_id, chunk)
+    
+    results = await asyncio.gather(*(delete_chunk_limited(chunk) for chunk in chunks), return_exceptions=True)
+    return sum(result for result in results if isinstance(result, int))
 
 
 async def show_week_schedule(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id: int):
     """Показать расписание на неделю после операций"""
     try:
-        # Удаляем прошедшие события перед показом расписания
-        delete_past_events(user_id)
         events = get_user_events(user_id)
         if events:
             text = format_events_list(events, 'week', str(user_id))
         else:
-            text = "Может устроить день дурака?"
+            text = NO_EVENTS_TEXT
         
         # Всегда показываем основную клавиатуру
         main_keyboard = get_main_keyboard()
@@ -956,48 +1587,31 @@ async def show_week_schedule(context: ContextTypes.DEFAULT_TYPE, user_id: int, c
         logger.error(f"❌ Ошибка при показе расписания пользователю {user_id}: {e}", exc_info=True)
 
 
-async def delete_user_messages(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id: int) -> int:
-    """Удаление всех сообщений бота и пользователя для пользователя с улучшенной обработкой ошибок"""
-    try:
-        messages_data = load_messages()
-        user_id_str = str(user_id)
-        deleted_count = 0
-        
-        # Удаляем сообщения бота
-        if user_id_str in messages_data:
-            message_ids = messages_data[user_id_str]
-            # Удаляем сообщения с небольшой задержкой, чтобы избежать rate limiting
-            for msg_id in message_ids:
-                try:
-                    await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
-                    deleted_count += 1
-                    # Небольшая задержка между удалениями (50ms)
-                    await asyncio.sleep(0.05)
-                except RetryAfter as e:
-                    # Если rate limit, ждем и продолжаем
-                    logger.warning(f"⚠️  Rate limit при удалении сообщений. Ждем {e.retry_after}с")
-                    await asyncio.sleep(e.retry_after)
-                except (TimedOut, NetworkError) as e:
-                    logger.warning(f"⚠️  Сетевая ошибка при удалении сообщения {msg_id}: {e}")
-                    continue
-                except Exception as e:
-                    # Игнорируем ошибки (сообщение уже удалено или недоступно)
-                    pass
-            
-            # Очищаем список сообщений бота
-            messages_data[user_id_str] = []
-            save_messages(messages_data)
-        
-        # Пытаемся удалить сообщения пользователя
-        # ВАЖНО: Это работает только в группах, если бот является администратором
-        # В личных чатах это не сработает из-за ограничений Telegram Bot API
-        user_deleted_count = await delete_user_sent_messages(context, user_id, chat_id)
-        deleted_count += user_deleted_count
-        
-        return deleted_count
-    except Exception as e:
-        logger.error(f"❌ Ошибка при удалении сообщений пользователя {user_id}: {e}", exc_info=True)
-        return 0
+def pop_user_message_ids(user_id: int) -> List[int]:
+    """Забрать ID всех отслеживаемых сообщений бота и пользователя, очистив их списки"""
+    user_id_str = str(user_id)
+    message_ids = []
+    messages_data = get_messages_data()
+    if messages_data.get(user_id_str):
+        message_ids.extend(messages_data[user_id_str])
+        messages_data[user_id_str] = []
+        save_messages(messages_data)
+    user_sent_data = get_user_sent_messages_data()
+    if user_sent_data.get(user_id_str):
+        message_ids.extend(user_sent_data[user_id_str])
+        user_sent_data[user_id_str] = []
+        save_user_sent_messages(user_sent_data)
+    return message_ids
+
+
+def delete_user_messages_in_background(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id: int,
+                                       extra_ids: Tuple[int, ...] = ()) -> None:
+    """Удаление сообщений пользователя в фоне: списки очищаются сразу,
+    поэтому новые сообщения, отправленные до завершения удаления, не затрагиваются"""
+    message_ids = pop_user_message_ids(user_id)
+    message_ids.extend(extra_ids)
+    if message_ids:
+        run_in_background(delete_messages_bulk(context.bot, chat_id, message_ids))
 
 
 def get_user_events(user_id: str) -> List[Dict]:
@@ -1006,6 +1620,43 @@ def get_user_events(user_id: str) -> List[Dict]:
     return data.get(str(user_id), [])
 
 
+# Отсортированные по (дата, время) события пользователя: user_id -> (даты, [(дата, время, событие)]).
+# Списки параллельные, по датам диапазон дней находится бинарным поиском. Сбрасывается при сохранении событий
+_sorted_events_cache: Dict[str, Tuple[List[date], List[Tuple[date, str, Dict]]]] = {}
+
+
+def get_sorted_user_events(user_id_str: str) -> Tuple[List[date], List[Tuple[date, str, Dict]]]:
+    """Индекс событий пользователя, отсортированных по дате и времени (строится один раз до изменения событий)"""
+    cached = _sorted_events_cache.get(user_id_str)
+    if cached is None:
+        entries = []
+        for event in load_data().get(user_id_str, []):
+            try:
+                entries.append((parse_event_date(event['date']), event['time'], event))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"⚠️  Не удалось обработать событие {event.get('id', 'unknown')}: {e}")
+        entries.sort(key=lambda item: (item[0], item[1]))
+        cached = _sorted_events_cache[user_id_str] = ([item[0] for item in entries], entries)
+    return cached
+
+
+# События пользователя по ID: user_id -> {id: событие}. Сбрасывается при сохранении событий
+_events_by_id_cache: Dict[str, Dict[str, Dict]] = {}
+
+
+def get_user_events_by_id(user_id: str) -> Dict[str, Dict]:
+    """События пользователя по ID (индекс строится один раз до изменения событий)"""
+    user_id_str = str(user_id)
+    by_id = _events_by_id_cache.get(user_id_str)
+    if by_id is None:
+        by_id = {}
+        for event in load_data().get(user_id_str, []):
+            # При повторяющихся ID, как и при линейном поиске, находится первое событие
+            by_id.setdefault(event.get('id'), event)
+        _events_by_id_cache[user_id_str] = by_id
+    return by_id
+
+
 def save_user_event(user_id: str, event: Dict):
     """Сохранение события пользователя с валидацией"""
     # Валидация события перед сохранением
@@ -1016,16 +1667,40 @@ def save_user_event(user_id: str, event: Dict):
     try:
         data = load_data()
         user_id_str = str(user_id)
-        if user_id_str not in data:
-            data[user_id_str] = []
-        data[user_id_str].append(event)
-        save_data(data)
+        _stamp_event(event, _get_reminder_tz(user_id_str))
+        data.setdefault(user_id_str, []).append(event)
+        _save_user_events_file(user_id_str)
+        mark_reminders_dirty(user_id_str)
         return True
     except Exception as e:
         logger.error(f"❌ Ошибка при сохранении события: {e}", exc_info=True)
         return False
 
 
+def add_user_events(user_id: str, events: List[Dict]) -> int:
+    """Добавление нескольких событий пользователя (серия повторов) с одной записью файла.
+    Невалидные события пропускаются; возвращает количество добавленных"""
+    user_id_str = str(user_id)
+    valid_events = []
+    for event in events:
+        if validate_event(event):
+            valid_events.append(event)
+        else:
+            logger.error(f"❌ Попытка сохранить невалидное событие: {event}")
+    if not valid_events:
+        return 0
+    
+    try:
+        stamp_user_events(user_id_str, valid_events)
+        load_data().setdefault(user_id_str, []).extend(valid_events)
+        _save_user_events_file(user_id_str)
+        mark_reminders_dirty(user_id_str)
+        return len(valid_events)
+    except Exception as e:
+        logger.error(f"❌ Ошибка при сохранении событий: {e}", exc_info=True)
+        return 0
+
+
 def update_user_event(user_id: str, event_id: str, updated_event: Dict):
     """Обновление события пользователя с валидацией"""
     # Валидация события перед обновлением
@@ -1034,33 +1709,74 @@ def update_user_event(user_id: str, event_id: str, updated_event: Dict):
         return False
     
     try:
-        data = load_data()
         user_id_str = str(user_id)
-        if user_id_str in data:
-            for i, event in enumerate(data[user_id_str]):
-                if event.get('id') == event_id:
-                    # Сохраняем источник из оригинального события, если он не указан в обновлении
-                    if 'source' not in updated_event and 'source' in event:
-                        updated_event['source'] = event['source']
-                    # Если источника нет ни в оригинале, ни в обновлении, устанавливаем по умолчанию
-                    if 'source' not in updated_event:
-                        updated_event['source'] = 'schedule'
-                    data[user_id_str][i] = updated_event
-                    save_data(data)
-                    return True
-        return False
+        # Событие находим по индексу ID и заменяем его содержимое на месте - проход по списку не нужен
+        event = get_user_events_by_id(user_id_str).get(event_id)
+        if event is None:
+            return False
+        # Сохраняем источник из оригинального события, если он не указан в обновлении
+        if 'source' not in updated_event and 'source' in event:
+            updated_event['source'] = event['source']
+        # Если источника нет ни в оригинале, ни в обновлении, устанавливаем по умолчанию
+        if 'source' not in updated_event:
+            updated_event['source'] = 'schedule'
+        _stamp_event(updated_event, _get_reminder_tz(user_id_str))
+        # Вызывающий код может передать уже сохраненный объект, измененный на месте
+        if updated_event is not event:
+            event.clear()
+            event.update(updated_event)
+        _save_user_events_file(user_id_str)
+        mark_reminders_dirty(user_id_str)
+        return True
     except Exception as e:
         logger.error(f"❌ Ошибка при обновлении события: {e}", exc_info=True)
         return False
 
 
+def bulk_update_events(updates: List[Tuple[str, str, Dict]]) -> int:
+    """Обновление пачки событий (user_id, event_id, событие) за один проход:
+    каждый затронутый пользователь сохраняется один раз. Возвращает количество обновленных событий"""
+    data = load_data()
+    updates_by_user: Dict[str, Dict[str, Dict]] = {}
+    for user_id, event_id, updated_event in updates:
+        if not validate_event(updated_event):
+            logger.error(f"❌ Попытка обновить невалидное событие: {updated_event}")
+            continue
+        updates_by_user.setdefault(str(user_id), {})[event_id] = updated_event
+    
+    updated_count = 0
+    for user_id_str, user_updates in updates_by_user.items():
+        events = data.get(user_id_str)
+        if not events:
+            continue
+        tz = _get_reminder_tz(user_id_str)
+        changed = False
+        for i, event in enumerate(events):
+            updated_event = user_updates.pop(event.get('id'), None)
+            if updated_event is None:
+                continue
+            # Источник сохраняется так же, как в update_user_event
+            if 'source' not in updated_event:
+                updated_event['source'] = event.get('source', 'schedule')
+            _stamp_event(updated_event, tz)
+            events[i] = updated_event
+            changed = True
+            updated_count += 1
+            if not user_updates:
+                break
+        if changed:
+            _save_user_events_file(user_id_str)
+            mark_reminders_dirty(user_id_str)
+    return updated_count
+
+
 def delete_user_event(user_id: str, event_id: str):
     """Удаление события пользователя"""
     data = load_data()
     user_id_str = str(user_id)
     if user_id_str in data:
         data[user_id_str] = [e for e in data[user_id_str] if e.get('id') != event_id]
-        save_data(data)
+        _save_user_events_file(user_id_str)
         return True
     return False
 
@@ -1071,7 +1787,7 @@ def delete_all_user_events(user_id: str):
     user_id_str = str(user_id)
     if user_id_str in data:
         data[user_id_str] = []
-        save_data(data)
+        _save_user_events_file(user_id_str)
         return True
     return False
 
@@ -1092,7 +1808,7 @@ def delete_past_events(user_id: str = None):
         user_timezone = get_user_timezone(user_id_str)
         if user_timezone:
             try:
-                tz = ZoneInfo(user_timezone)
+                tz = get_zoneinfo(user_timezone)
                 now = datetime.now(tz)
             except Exception as e:
                 logger.warning(f"⚠️  Ошибка при получении часового пояса {user_timezone} для пользователя {user_id_str}: {e}")
@@ -1100,11 +1816,8 @@ def delete_past_events(user_id: str = None):
         else:
             now = datetime.now()
         
-        # Получаем сегодняшнюю дату (как naive для сравнения)
-        if now.tzinfo is not None:
-            today_date = now.date()
-        else:
-            today_date = now.replace(hour=0, minute=0, second=0, microsecond=0).date()
+        # Сегодняшняя дата как строка YYYY-MM-DD: даты событий в том же формате сравниваются как строки, без разбора
+        today_iso = now.date().isoformat()
         
         events = data[user_id_str]
         remaining_events = []
@@ -1112,140 +1825,193 @@ def delete_past_events(user_id: str = None):
         for event in events:
             try:
                 # Проверяем дату события (события хранятся как naive даты)
-                event_date = datetime.strptime(event['date'], '%Y-%m-%d')
+                event_date = event['date']
+                if len(event_date) != 10:
+                    # Старые записи без ведущих нулей (2024-1-5) строковому сравнению не подходят
+                    event_date = parse_event_date(event_date).isoformat()
                 
                 # Удаляем событие только если дата события уже прошла (меньше сегодняшней даты) - вчера и раньше
                 # События сегодняшнего дня не удаляем, даже если их время уже прошло
-                if event_date.date() < today_date:
+                if event_date < today_iso:
                     # Событие было в прошлом дне (вчера и раньше) - удаляем
                     deleted_count += 1
-                    logger.debug(f"🗑️  Удаление прошедшего события: {event.get('title', 'N/A')} на {event['date']}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("🗑️  Удаление прошедшего события: %s на %s", event.get('title', 'N/A'), event['date'])
                     continue
                 
                 remaining_events.append(event)
-            except (ValueError, KeyError) as e:
+            except (ValueError, KeyError, TypeError) as e:
                 # Если не удалось распарсить дату/время, оставляем событие
                 logger.warning(f"⚠️  Не удалось обработать событие {event.get('id', 'unknown')}: {e}")
                 remaining_events.append(event)
         
-        data[user_id_str] = remaining_events
+        if len(remaining_events) != len(events):
+            data[user_id_str] = remaining_events
+            _save_user_events_file(user_id_str)
     
     if deleted_count > 0:
-        save_data(data)
         logger.info(f"🗑️  Удалено прошедших событий: {deleted_count}")
     
     return deleted_count
 
 
+# Очередь напоминаний: куча (время срабатывания UTC timestamp, user_id, event_id, минуты до события).
+# Записи не удаляются при изменении событий, а проверяются при извлечении (ленивая инвалидация)
+REMINDER_WINDOW = 60  # Напоминание отправляется в пределах ±60 секунд от своего времени
+_reminder_heap: List[Tuple[float, str, str, int]] = []
+_queued_reminders: Dict[Tuple[str, str, int], float] = {}  # Актуальное время каждого напоминания в очереди
+_reminders_dirty_users: set = set()
+_reminders_rebuild_needed = True
+
+
+def mark_reminders_dirty(user_id: Optional[str] = None):
+    """Пометка напоминаний пользователя (или всех, если user_id не указан) для пересчета в очереди"""
+    global _reminders_rebuild_needed
+    if user_id is None:
+        _reminders_rebuild_needed = True
+    else:
+        _reminders_dirty_users.add(str(user_id))
+
+
+def _get_reminder_tz(user_id_str: str) -> ZoneInfo:
+    """Часовой пояс для напоминаний пользователя (без часового пояса время событий считается в UTC)"""
+    user_timezone = get_user_timezone(user_id_str)
+    if user_timezone:
+        try:
+            return get_zoneinfo(user_timezone)
+        except Exception as e:
+            logger.warning(f"⚠️  Ошибка при получении часового пояса {user_timezone} для пользователя {user_id_str}: {e}")
+    return get_zoneinfo('UTC')
+
+
+def _get_event_reminders(event: Dict) -> List[int]:
+    """Список напоминаний события (поддержка старого формата reminder_minutes и нового reminders)"""
+    reminders = event.get('reminders', [])
+    if not reminders:
+        old_reminder = event.get('reminder_minutes')
+        if old_reminder is not None:
+            reminders = [old_reminder]
+    return reminders
+
+
+def _event_timestamp(event: Dict, tz: ZoneInfo) -> float:
+    """UTC timestamp начала события (время события интерпретируется в часовом поясе пользователя)"""
+    return datetime.combine(parse_event_date(event['date']), parse_event_time(event['time']), tzinfo=tz).timestamp()
+
+
+def _stamp_event(event: Dict, tz: ZoneInfo) -> bool:
+    """Запись в событие event_ts_utc - UTC timestamp начала события, чтобы не разбирать дату и время при каждой проверке"""
+    try:
+        event_ts = int(_event_timestamp(event, tz))
+    except (ValueError, KeyError, TypeError):
+        return False
+    if event.get('event_ts_utc') == event_ts:
+        return False
+    event['event_ts_utc'] = event_ts
+    return True
+
+
+def stamp_user_events(user_id_str: str, events: Optional[List[Dict]] = None) -> int:
+    """Пересчет event_ts_utc событий пользователя (при сохранении и смене часового пояса), возвращает число измененных"""
+    if events is None:
+        events = load_data().get(user_id_str, [])
+    tz = _get_reminder_tz(user_id_str)
+    return sum(_stamp_event(event, tz) for event in events)
+
+
+def _get_event_ts(event: Dict, tz: ZoneInfo) -> float:
+    """UTC timestamp начала события: сохраненный event_ts_utc или вычисленный по дате и времени"""
+    event_ts = event.get('event_ts_utc')
+    if event_ts is None:
+        event_ts = _event_timestamp(event, tz)
+    return event_ts
+
+
+def _push_user_reminders(user_id_str: str, events: List[Dict], now_ts: float):
+    """Добавление в очередь предстоящих напоминаний пользователя"""
+    tz = _get_reminder_tz(user_id_str)
+    for event in events:
+        reminders = _get_event_reminders(event)
+        # Пропускаем события без напоминаний, даты или времени
+        if not reminders or not event.get('date') or not event.get('time'):
+            continue
+        try:
+            event_ts = _get_event_ts(event, tz)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"⚠️  Ошибка при обработке события для напоминания: {e}")
+            continue
+        reminder_sent = event.get('reminder_sent', [])
+        if not isinstance(reminder_sent, list):
+            reminder_sent = []
+        for reminder_minutes in reminders:
+            fire_ts = event_ts - reminder_minutes * 60
+            if reminder_minutes in reminder_sent or fire_ts < now_ts - REMINDER_WINDOW:
+                continue
+            key = (user_id_str, event.get('id'), reminder_minutes)
+            if _queued_reminders.get(key) != fire_ts:
+                _queued_reminders[key] = fire_ts
+                heapq.heappush(_reminder_heap, (fire_ts, user_id_str, event.get('id'), reminder_minutes))
+
+
+def _rebuild_reminder_heap(data: Dict[str, List[Dict]], now_ts: float):
+    """Полное построение очереди напоминаний по всем событиям"""
+    global _reminders_rebuild_needed
+    _reminder_heap.clear()
+    _queued_reminders.clear()
+    for user_id_str, events in data.items():
+        _push_user_reminders(user_id_str, events, now_ts)
+    _reminders_dirty_users.clear()
+    _reminders_rebuild_needed = False
+
+
 def get_events_for_reminder() -> List[tuple]:
     """Получение событий, для которых нужно отправить напоминание
     Возвращает список кортежей (user_id, event, reminder_minutes)
     Учитывает часовой пояс каждого пользователя"""
     data = load_data()
-    events_to_remind = []
+    now_ts = time.time()
     
-    for user_id_str, events in data.items():
-        # Получаем часовой пояс пользователя
-        user_timezone = get_user_timezone(user_id_str)
-        
-        # Определяем текущее время в часовом поясе пользователя
-        if user_timezone:
-            try:
-                tz = ZoneInfo(user_timezone)
-                now = datetime.now(tz)
-            except Exception as e:
-                logger.warning(f"⚠️  Ошибка при получении часового пояса {user_timezone} для пользователя {user_id_str}: {e}")
-                # Используем UTC как fallback
-                now = datetime.now(ZoneInfo('UTC'))
-        else:
-            # Если часовой пояс не установлен, используем UTC
-            now = datetime.now(ZoneInfo('UTC'))
+    if _reminders_rebuild_needed:
+        _rebuild_reminder_heap(data, now_ts)
+    elif _reminders_dirty_users:
+        # Старые записи измененных пользователей отсеются проверкой при извлечении
+        dirty_users = list(_reminders_dirty_users)
+        _reminders_dirty_users.clear()
+        for user_id_str in dirty_users:
+            _push_user_reminders(user_id_str, data.get(user_id_str, []), now_ts)
+    
+    events_to_remind = []
+    while _reminder_heap and _reminder_heap[0][0] < now_ts + REMINDER_WINDOW:
+        fire_ts, user_id_str, event_id, reminder_minutes = heapq.heappop(_reminder_heap)
+        key = (user_id_str, event_id, reminder_minutes)
+        # Запись заменена более новой (событие или часовой пояс изменились)
+        if _queued_reminders.get(key) != fire_ts:
+            continue
+        del _queued_reminders[key]
+        # Время напоминания прошло больше минуты назад - пропущено
+        if fire_ts < now_ts - REMINDER_WINDOW:
+            continue
         
-        for event in events:
-            # Поддержка старого формата (reminder_minutes) и нового (reminders)
-            reminders = event.get('reminders', [])
-            if not reminders:
-                # Проверяем старый формат для обратной совместимости
-                old_reminder = event.get('reminder_minutes')
-                if old_reminder is not None:
-                    reminders = [old_reminder]
-                else:
-                    continue
-            
-            # Пропускаем события без даты или времени
-            if not event.get('date') or not event.get('time'):
-                continue
-            
-            try:
-                # Парсим дату и время события (время интерпретируется в часовом поясе пользователя)
-                event_date = datetime.strptime(event['date'], '%Y-%m-%d')
-                event_time = datetime.strptime(event['time'], '%H:%M').time()
-                
-                # Создаем datetime в часовом поясе пользователя
-                if user_timezone:
-                    try:
-                        tz = ZoneInfo(user_timezone)
-                        # Создаем naive datetime и затем делаем его aware
-                        event_datetime_naive = datetime.combine(event_date.date(), event_time)
-                        event_datetime = event_datetime_naive.replace(tzinfo=tz)
-                    except Exception as e:
-                        logger.warning(f"⚠️  Ошибка при создании datetime для часового пояса {user_timezone}: {e}")
-                        event_datetime = datetime.combine(event_date.date(), event_time)
-                else:
-                    # Если часовой пояс не установлен, используем naive datetime
-                    event_datetime = datetime.combine(event_date.date(), event_time)
-                
-                # Проверяем каждое напоминание
-                reminder_sent = event.get('reminder_sent', [])
-                if not isinstance(reminder_sent, list):
-                    # Старый формат - преобразуем в список
-                    reminder_sent = []
-                
-                for reminder_minutes in reminders:
-                    # Вычисляем время напоминания
-                    reminder_datetime = event_datetime - timedelta(minutes=reminder_minutes)
-                    
-                    # Убеждаемся, что оба datetime в одном формате (aware или naive)
-                    # Всегда работаем с aware datetime для точности
-                    if reminder_datetime.tzinfo is None:
-                        # Если reminder_datetime naive, делаем его aware в часовом поясе пользователя
-                        if user_timezone:
-                            try:
-                                tz = ZoneInfo(user_timezone)
-                                reminder_datetime = reminder_datetime.replace(tzinfo=tz)
-                            except Exception as e:
-                                logger.warning(f"⚠️  Ошибка при установке часового пояса для напоминания: {e}")
-                                # Используем UTC как fallback
-                                reminder_datetime = reminder_datetime.replace(tzinfo=ZoneInfo('UTC'))
-                        else:
-                            # Если часовой пояс не установлен, используем UTC
-                            reminder_datetime = reminder_datetime.replace(tzinfo=ZoneInfo('UTC'))
-                    
-                    # Убеждаемся, что now тоже aware (должно быть уже установлено выше, но проверяем на всякий случай)
-                    if now.tzinfo is None:
-                        if user_timezone:
-                            try:
-                                tz = ZoneInfo(user_timezone)
-                                now = datetime.now(tz)
-                            except Exception as e:
-                                logger.warning(f"⚠️  Ошибка при установке часового пояса для now: {e}")
-                                now = datetime.now(ZoneInfo('UTC'))
-                        else:
-                            now = datetime.now(ZoneInfo('UTC'))
-                    
-                    # Теперь оба datetime должны быть aware - вычисляем разницу
-                    time_diff = (reminder_datetime - now).total_seconds()
-                    
-                    # Отправляем напоминание, если время пришло (в пределах 1 минуты до и после)
-                    # Расширяем окно до 2 минут для надежности
-                    if -60 <= time_diff < 60:
-                        # Проверяем, не было ли уже отправлено это напоминание
-                        if reminder_minutes not in reminder_sent:
-                            logger.debug(f"🔔 Найдено событие для напоминания: пользователь {user_id_str}, событие {event.get('title', 'N/A')}, напоминание за {reminder_minutes} мин, время события {event_datetime}, время напоминания {reminder_datetime}, сейчас {now}, разница {time_diff}с")
-                            events_to_remind.append((user_id_str, event, reminder_minutes))
-            except (ValueError, KeyError) as e:
-                logger.warning(f"⚠️  Ошибка при обработке события для напоминания: {e}")
+        # Проверяем, что запись в очереди соответствует актуальному состоянию события
+        event = get_user_events_by_id(user_id_str).get(event_id)
+        if event is None or reminder_minutes not in _get_event_reminders(event):
+            continue
+        reminder_sent = event.get('reminder_sent', [])
+        if isinstance(reminder_sent, list) and reminder_minutes in reminder_sent:
+            continue
+        try:
+            if _get_event_ts(event, _get_reminder_tz(user_id_str)) - reminder_minutes * 60 != fire_ts:
                 continue
+        except (ValueError, KeyError, TypeError):
+            continue
+        
+        # Проверка уровня до форматирования: в продакшене DEBUG выключен, а datetime для лога не бесплатен
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔔 Найдено событие для напоминания: пользователь %s, событие %s, напоминание за %d мин, время напоминания %s, разница %.0fс",
+                         user_id_str, event.get('title', 'N/A'), reminder_minutes, datetime.fromtimestamp(fire_ts), fire_ts - now_ts)
+        events_to_remind.append((user_id_str, event, reminder_minutes))
+        # Если отправка не удастся, напоминание вернется в очередь на следующей проверке
+        _reminders_dirty_users.add(user_id_str)
     
     return events_to_remind
 
@@ -1269,6 +2035,8 @@ async def send_message_safe(bot, chat_id: int, text: str, **kwargs):
 
 async def send_reminders(context: ContextTypes.DEFAULT_TYPE):
     """Фоновая задача для отправки напоминаний с улучшенной обработкой ошибок"""
+    # Отметки об отправленных напоминаниях сохраняются одной пачкой после цикла
+    sent_updates: List[Tuple[str, str, Dict]] = []
     try:
         events_to_remind = get_events_for_reminder()
         
@@ -1278,7 +2046,7 @@ async def send_reminders(context: ContextTypes.DEFAULT_TYPE):
         for user_id_str, event, reminder_minutes in events_to_remind:
             try:
                 user_id = int(user_id_str)
-                event_date = datetime.strptime(event['date'], '%Y-%m-%d')
+                event_date = parse_event_date(event['date'])
                 date_str = event_date.strftime('%d.%m.%Y')
                 weekday = get_weekday(event_date)
                 
@@ -1317,8 +2085,8 @@ async def send_reminders(context: ContextTypes.DEFAULT_TYPE):
                 if reminder_minutes not in reminder_sent:
                     reminder_sent.append(reminder_minutes)
                 event['reminder_sent'] = reminder_sent
-                update_user_event(user_id_str, event['id'], event)
-                logger.debug(f"✅ Напоминание помечено как отправленное для события {event.get('id', 'N/A')}")
+                sent_updates.append((user_id_str, event['id'], event))
+                logger.debug("✅ Напоминание помечено как отправленное для события %s", event.get('id', 'N/A'))
                 
             except (RetryAfter, TimedOut, NetworkError) as e:
                 logger.warning(f"⚠️  Временная ошибка при отправке напоминания пользователю {user_id_str}: {e}")
@@ -1331,144 +2099,140 @@ async def send_reminders(context: ContextTypes.DEFAULT_TYPE):
                 continue
     except Exception as e:
         logger.error(f"❌ Критическая ошибка в функции send_reminders: {e}", exc_info=True)
+    finally:
+        if sent_updates:
+            bulk_update_events(sent_updates)
+
+
+@dataclass
+class UserCtx:
+    """Данные пользователя, нужные для отрисовки (собираются один раз на запрос)"""
+    tz: Optional[ZoneInfo]
+    categories: Dict[str, str]
+    now: datetime
+    today: date
+
+
+def get_user_ctx(user_id: str = None) -> UserCtx:
+    """Сбор контекста пользователя: часовой пояс, категории, текущее время и дата"""
+    tz = None
+    categories = DEFAULT_CATEGORIES
+    if user_id:
+        user_timezone = get_user_timezone(user_id)
+        if user_timezone:
+            try:
+                tz = get_zoneinfo(user_timezone)
+            except (ZoneInfoNotFoundError, ValueError):
+                tz = None
+        categories = get_user_categories(user_id)
+    now = datetime.now(tz) if tz else datetime.now()
+    return UserCtx(tz=tz, categories=categories, now=now, today=now.date())
 
 
-def format_event(event: Dict, user_id: str = None) -> str:
+def format_event(event: Dict, user_id: str = None, ctx: Optional[UserCtx] = None) -> str:
     """Форматирование события для отображения"""
-    date_obj = datetime.strptime(event['date'], '%Y-%m-%d')
+    if ctx is None:
+        ctx = get_user_ctx(user_id)
+    
+    date_obj = parse_event_date(event['date'])
     date_str = date_obj.strftime('%d.%m.%Y')
     weekday = get_weekday(date_obj)
     
-    # Получаем категории пользователя
-    if user_id:
-        user_categories = get_user_categories(user_id)
-        category_name = user_categories.get(event.get('category', 'other'), 'остальное')
-    else:
-        category_name = DEFAULT_CATEGORIES.get(event.get('category', 'other'), 'остальное')
+    category_name = ctx.categories.get(event.get('category', 'other'), 'остальное')
     
-    text = f"<b>{event['title']}</b>\n"
-    text += f"дата: {date_str} ({weekday})\n"
-    text += f"время: {event['time']}\n"
-    text += f"название: {event['title']}\n"
-    text += f"категория ({category_name})\n"
+    parts = [
+        f"<b>{event['title']}</b>\n",
+        f"дата: {date_str} ({weekday})\n",
+        f"время: {event['time']}\n",
+        f"название: {event['title']}\n",
+        f"категория ({category_name})\n",
+    ]
     
     if event.get('description'):
-        text += f"описание: {event['description']}\n"
+        parts.append(f"описание: {event['description']}\n")
     
-    return text
+    return ''.join(parts)
 
 
-def format_events_list(events: List[Dict], filter_type: str = 'all', user_id: str = None) -> str:
+def format_events_list(events: List[Dict], filter_type: str = 'all', user_id: str = None,
+                       ctx: Optional[UserCtx] = None) -> str:
     """Форматирование списка событий с группировкой по датам
     Учитывает часовой пояс пользователя"""
     if not events:
-        return "Может устроить день дурака?"
-    
-    # Получаем текущее время в часовом поясе пользователя
-    if user_id:
-        user_timezone = get_user_timezone(user_id)
-        if user_timezone:
-            try:
-                tz = ZoneInfo(user_timezone)
-                now = datetime.now(tz)
-            except:
-                now = datetime.now()
-        else:
-            now = datetime.now()
-    else:
-        now = datetime.now()
+        return NO_EVENTS_TEXT
     
-    # Получаем сегодняшнюю дату в часовом поясе пользователя (как naive для сравнения)
-    if now.tzinfo is not None:
-        today_naive = now.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
-        today_date = now.date()
-    else:
-        today_naive = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        today_date = today_naive.date()
+    # Часовой пояс, категории и сегодняшняя дата пользователя - один раз на весь список
+    if ctx is None:
+        ctx = get_user_ctx(user_id)
+    today_date = ctx.today
+    user_categories = ctx.categories
     
-    # Фильтрация событий по датам (сравниваем naive даты)
+    # Дата каждого события разбирается один раз; по ней же фильтруем (naive даты), сортируем и группируем.
+    # 'upcoming' - все события начиная с сегодня: прошедшие дни скрываются без удаления (их удаляет фоновая очистка),
+    # 'all' - все события без фильтра
     if filter_type == 'today':
-        events = [e for e in events if datetime.strptime(e['date'], '%Y-%m-%d').date() == today_date]
+        date_range = (today_date, today_date)
     elif filter_type == 'tomorrow':
         tomorrow_date = today_date + timedelta(days=1)
-        events = [e for e in events if datetime.strptime(e['date'], '%Y-%m-%d').date() == tomorrow_date]
+        date_range = (tomorrow_date, tomorrow_date)
     elif filter_type == 'week':
-        week_end_date = today_date + timedelta(days=7)
-        events = [e for e in events if today_date <= datetime.strptime(e['date'], '%Y-%m-%d').date() <= week_end_date]
-    
-    if not events:
-        if filter_type == 'today':
-            return "Может устроить день дурака?"
-        elif filter_type == 'tomorrow':
-            return "Может устроить день дурака?"
-        return "Может устроить день дурака?"
-    
-    # Получаем категории пользователя
-    if user_id:
-        user_categories = get_user_categories(user_id)
+        date_range = (today_date, today_date + timedelta(days=7))
+    elif filter_type == 'upcoming':
+        date_range = (today_date, date.max)
     else:
-        user_categories = DEFAULT_CATEGORIES.copy()
+        date_range = (date.min, date.max)
     
-    # Сортировка по дате и времени (хронологический порядок)
-    events.sort(key=lambda x: (x['date'], x['time']))
+    if user_id and events is load_data().get(str(user_id)):
+        # Все события пользователя: диапазон дней вырезается из отсортированного индекса без разбора дат
+        dates, entries = get_sorted_user_events(str(user_id))
+        parsed_events = entries[bisect.bisect_left(dates, date_range[0]):bisect.bisect_right(dates, date_range[1])]
+    else:
+        parsed_events = []
+        for event in events:
+            event_date = parse_event_date(event['date'])
+            if date_range[0] <= event_date <= date_range[1]:
+                parsed_events.append((event_date, event['time'], event))
+        
+        # Сортировка по дате и времени (хронологический порядок)
+        parsed_events.sort(key=lambda item: (item[0], item[1]))
     
-    # Группировка событий по датам
-    events_by_date = {}
-    for event in events:
-        date_key = event['date']
-        if date_key not in events_by_date:
-            events_by_date[date_key] = []
-        events_by_date[date_key].append(event)
+    if not parsed_events:
+        return NO_EVENTS_TEXT
     
-    text = ""
+    parts = []
     
     # Отображаем события по датам (в хронологическом порядке)
-    for date_key in sorted(events_by_date.keys()):
-        date_obj = datetime.strptime(date_key, '%Y-%m-%d')
-        
-        # Форматируем дату
-        date_str = format_date_natural(date_obj)
-        weekday = get_weekday_short(date_obj).lower()  # Сокращенный день недели с маленькой буквы
+    for event_date, group in groupby(parsed_events, key=lambda item: item[0]):
+        day_events = [item[2] for item in group]
         
-        # Выводим дату жирным, день недели обычным
-        text += f"<b>{date_str}</b>, {weekday}\n"
+        parts.append(_format_day_header(event_date))
         
         # Добавляем пустую строку после даты для фильтров "сегодня" и "завтра"
         if filter_type == 'today' or filter_type == 'tomorrow':
-            text += "\n"
+            parts.append("\n")
         
-        # Выводим события этого дня (уже отсортированные по времени)
-        day_events = events_by_date[date_key]
-        # Дополнительная сортировка по времени для гарантии хронологического порядка
-        day_events.sort(key=lambda x: x['time'])
         for i, event in enumerate(day_events):
-            # Время
-            time_str = event['time']
-            
-            # Название
-            title_str = event['title']
-            
             # Категория
             category_name = user_categories.get(event.get('category', 'other'), 'остальное')
             
             # Формируем строку события в новом формате
             # Время подчеркнутое и курсивом
-            text += f"<u><i>{time_str}</i></u>\n"
+            parts.append(f"<u><i>{event['time']}</i></u>\n")
             # Название
-            text += f"{title_str}\n"
+            parts.append(f"{event['title']}\n")
             # Категория с |
-            text += f"|{category_name}\n"
+            parts.append(f"|{category_name}\n")
             # Описание (если есть)
             if event.get('description'):
-                text += f"{event['description']}\n"
+                parts.append(f"{event['description']}\n")
             
             # Добавляем пустую строку между событиями (но не после последнего события дня)
             if i < len(day_events) - 1:
-                text += "\n"
+                parts.append("\n")
         
-        text += "\n"  # Пустая строка между датами
+        parts.append("\n")  # Пустая строка между датами
     
-    return text
+    return ''.join(parts)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1562,16 +2326,16 @@ async def city_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Сохраняем ID сообщения пользователя
     add_user_message_id(user_id, update.message.message_id)
     
-    # Показываем, что обрабатываем запрос
-    processing_msg = await update.message.reply_text(
-        f"🔍 Определяю часовой пояс для города <b>{city_name}</b>...",
-        parse_mode='HTML'
+    # Показываем, что обрабатываем запрос, и одновременно определяем часовой пояс по городу
+    processing_msg, timezone_name = await asyncio.gather(
+        update.message.reply_text(
+            f"🔍 Определяю часовой пояс для города <b>{city_name}</b>...",
+            parse_mode='HTML'
+        ),
+        get_timezone_by_city(city_name)
     )
     add_message_id(user_id, processing_msg.message_id)
     
-    # Определяем часовой пояс по городу
-    timezone_name = get_timezone_by_city(city_name)
-    
     if timezone_name:
         # Сохраняем город и часовой пояс
         set_user_city(user_id, city_name)
@@ -1579,18 +2343,15 @@ async def city_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Получаем информацию о часовом поясе для отображения
         try:
-            tz = ZoneInfo(timezone_name)
+            tz = get_zoneinfo(timezone_name)
             now = datetime.now(tz)
             offset = now.strftime('%z')
             offset_formatted = f"{offset[:3]}:{offset[3:]}" if len(offset) >= 5 else offset
-        except:
+        except (ZoneInfoNotFoundError, ValueError):
             offset_formatted = ""
         
-        # Удаляем сообщение об обработке
-        try:
-            await processing_msg.delete()
-        except:
-            pass
+        # Удаляем сообщение об обработке параллельно с отправкой ответа
+        delete_message_in_background(processing_msg)
         
         # Показываем успешное сообщение
         success_text = (
@@ -1601,19 +2362,12 @@ async def city_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if offset_formatted:
             success_text += f"\nСмещение: UTC{offset_formatted}"
         
-        msg = await update.message.reply_text(
-            success_text,
-            parse_mode='HTML'
-        )
-        add_message_id(user_id, msg.message_id)
-        
         # Проверяем категории пользователя
         user_categories = get_user_categories(user_id)
         
-        welcome_text = ''
         # Если у пользователя нет категорий или только стандартная "остальное", предлагаем создать
         if not user_categories or (len(user_categories) == 1 and 'other' in user_categories):
-            welcome_text = (
+            success_text += (
                 '\n\nНачни с добавления категорий. Они помогут для более удобной организации событий.\n\n'
                 'Пример категорий:\n'
                 'Учеба\n'
@@ -1623,10 +2377,10 @@ async def city_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 'Нажмите "✏️" → "управление категориями" для настройки.'
             )
         
-        # Показываем основную клавиатуру
+        # Одно сообщение вместе с основной клавиатурой
         keyboard = get_main_keyboard()
         msg = await update.message.reply_text(
-            welcome_text if welcome_text else "Выберите действие:",
+            success_text,
             parse_mode='HTML',
             reply_markup=keyboard
         )
@@ -1635,16 +2389,13 @@ async def city_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     else:
         # Если не удалось определить часовой пояс
-        try:
-            await processing_msg.delete()
-        except:
-            pass
+        delete_message_in_background(processing_msg)
         
         if not GEOCODING_AVAILABLE:
             # Если библиотеки недоступны
             error_msg = await update.message.reply_text(
                 f"⚠️ Автоматическое определение часового пояса временно недоступно.\n\n"
-                "Библиотеки geopy и timezonefinder не установлены в системе.\n\n"
+                "Библиотеки geopy и tzfpy не установлены в системе.\n\n"
                 "Бот попытался установить их автоматически при запуске.\n"
                 "Если вы видите это сообщение, пожалуйста:\n"
                 "1. Обратитесь к администратору\n"
@@ -1697,9 +2448,8 @@ async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return WAITING_CITY
 
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /help"""
-    help_text = """
+# Справка (строится один раз при загрузке модуля)
+HELP_TEXT = """
 📖 <b>Справка по использованию бота:</b>
 
 <b>Основные кнопки:</b>
@@ -1734,12 +2484,15 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 <b>Удаление:</b>
 В меню редактирования можно удалить отдельное событие или всё расписание.
+"""
+HELP_COMMAND_TEXT = HELP_TEXT + "\n<b>Совет:</b> События автоматически сортируются по дате и времени!\n"
 
-<b>Совет:</b> События автоматически сортируются по дате и времени!
-    """
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /help"""
     keyboard = get_main_keyboard()
     msg = await update.message.reply_text(
-        help_text, 
+        HELP_COMMAND_TEXT,
         parse_mode='HTML',
         reply_markup=keyboard
     )
@@ -1790,37 +2543,23 @@ async def add_event_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Получаем часовой пояс пользователя
         user_timezone = get_user_timezone(str(user_id))
         
-        # Получаем текущее время в часовом поясе пользователя
-        if user_timezone:
-            try:
-                tz = ZoneInfo(user_timezone)
-                now = datetime.now(tz)
-                today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            except Exception as e:
-                logger.warning(f"⚠️  Ошибка при получении времени в часовом поясе {user_timezone}: {e}")
-                today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        else:
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # Сохраняем naive версию today для сравнения
-        today_naive = today.replace(tzinfo=None) if today.tzinfo else today
+        # Начало текущих суток в часовом поясе пользователя (тот же кэш, что и в parse_natural_date),
+        # как naive datetime - даты событий хранятся без часового пояса
+        today_naive = get_today_start(user_timezone).replace(tzinfo=None)
         
         date_str = update.message.text.strip().lower()
         date_obj = None
         
-        logger.info(f"📅 Обработка даты: '{date_str}', часовой пояс пользователя: {user_timezone}")
-        logger.info(f"📅 RELATIVE_DATES содержит: {list(RELATIVE_DATES.keys())}")
-        logger.info(f"📅 Проверка: '{date_str}' in RELATIVE_DATES = {date_str in RELATIVE_DATES}")
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            logger.debug("📅 Обработка даты: '%s', часовой пояс пользователя: %s", date_str, user_timezone)
         
         # Проверяем относительные даты (сегодня, завтра, послезавтра)
-        if date_str in RELATIVE_DATES:
-            days_offset = RELATIVE_DATES[date_str]
-            logger.info(f"✅ Найдена относительная дата: '{date_str}', смещение: {days_offset} дней")
-            date_obj = today + timedelta(days=days_offset)
-            # Убираем timezone info для дальнейшей обработки
-            if date_obj.tzinfo is not None:
-                date_obj = date_obj.replace(tzinfo=None)
-            logger.info(f"✅ Результат: {date_obj.date()}")
+        days_offset = RELATIVE_DATES.get(date_str)
+        if days_offset is not None:
+            date_obj = today_naive + timedelta(days=days_offset)
+            if debug_enabled:
+                logger.debug("✅ Относительная дата '%s' (смещение %d дн.) -> %s", date_str, days_offset, date_obj.date())
         else:
             # Сначала пробуем парсить естественные формулировки с учетом часового пояса
             date_obj = parse_natural_date(date_str, user_timezone)
@@ -1840,25 +2579,9 @@ async def add_event_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     except ValueError:
                         pass
             
-            # Если все еще не получилось, пробуем стандартные форматы
+            # Если все еще не получилось, пробуем числовые форматы
             if date_obj is None:
-                # Пробуем различные форматы дат
-                date_formats = [
-                    '%d.%m.%Y', '%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', 
-                    '%d.%m.%y', '%d/%m/%y', '%d.%m', '%d/%m',
-                    '%d-%m', '%Y.%m.%d', '%Y/%m/%d'
-                ]
-                for fmt in date_formats:
-                    try:
-                        date_obj = datetime.strptime(date_str, fmt)
-                        # Если формат без года, добавляем текущий год
-                        if fmt in ['%d.%m', '%d/%m', '%d-%m']:
-                            date_obj = date_obj.replace(year=today_naive.year)
-                            if date_obj < today_naive:
-                                date_obj = date_obj.replace(year=today_naive.year + 1)
-                        break
-                    except ValueError:
-                        continue
+                date_obj = parse_numeric_date(date_str, today_naive)
         
         if date_obj is None:
             logger.warning(f"⚠️  Не удалось распарсить дату: {date_str}")
@@ -1868,13 +2591,8 @@ async def add_event_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if date_obj.tzinfo is not None:
             date_obj = date_obj.replace(tzinfo=None)
         
-        # Убираем timezone info из today для сравнения, если он есть
-        if today.tzinfo is not None:
-            today_naive = today.replace(tzinfo=None)
-        else:
-            today_naive = today
-        
-        logger.debug(f"📅 Распарсена дата: {date_str} -> {date_obj.date()}, сегодня: {today_naive.date()}")
+        if debug_enabled:
+            logger.debug("📅 Распарсена дата: %s -> %s, сегодня: %s", date_str, date_obj.date(), today_naive.date())
         
         # Проверяем, что дата не в прошлом (кроме сегодня)
         if date_obj.date() < today_naive.date():
@@ -1893,7 +2611,7 @@ async def add_event_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             add_message_id(update.effective_user.id, msg.message_id)
             return WAITING_DATE
         
-        context.user_data['new_event']['date'] = date_obj.strftime('%Y-%m-%d')
+        context.user_data['new_event']['date'] = date_obj.date().isoformat()
         msg = await update.message.reply_text(
             "во сколько?\n\nМожно ввести время:\n"
             "• Только часы: 12, 13, 9\n"
@@ -1941,16 +2659,15 @@ async def add_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
         now = datetime.now()
         hours_to_add = None
         
-        if time_str == "через час":
-            hours_to_add = 1
-        elif time_str == "через полтора часа":
-            hours_to_add = 1.5
-        elif time_str.startswith("через ") and time_str.endswith(" часа"):
-            try:
-                hours_str = time_str.replace("через ", "").replace(" часа", "").strip()
-                hours_to_add = float(hours_str)
-            except:
-                pass
+        relative_match = _RELATIVE_TIME_RE.match(time_str)
+        if relative_match:
+            one_and_half, hours_str = relative_match.groups()
+            if one_and_half:
+                hours_to_add = 1.5
+            elif hours_str:
+                hours_to_add = float(hours_str.replace(',', '.'))
+            else:
+                hours_to_add = 1
         
         if hours_to_add is not None:
             # Вычисляем время через указанное количество часов
@@ -1989,7 +2706,7 @@ async def add_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
             time_str = time_str.replace(' ', ':')
         
         # Проверяем оба формата: ЧЧ:ММ и ЧЧ ММ
-        datetime.strptime(time_str, '%H:%M')
+        time_str = normalize_time_input(time_str)
         # Сохраняем в стандартном формате ЧЧ:ММ
         context.user_data['new_event']['time'] = time_str
         
@@ -2000,7 +2717,8 @@ async def add_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         add_message_id(update.effective_user.id, msg.message_id)
         return WAITING_DESCRIPTION
-    except:
+    except (ValueError, OverflowError):
+        # Неверный формат или слишком большое смещение "через N часа"
         msg = await update.message.reply_text(
             "Неверный формат времени. Попробуйте снова:\n"
             "• Только часы: 12, 13, 9\n"
@@ -2011,6 +2729,25 @@ async def add_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WAITING_TIME
 
 
+_MANAGE_CATEGORIES_BUTTON = ("управление категориями", "manage_categories")
+_BACK_TO_CATEGORIES_BUTTON = ("◀️ Назад", "manage_categories")
+
+
+@lru_cache(maxsize=256)
+def _build_category_keyboard(categories: Tuple[Tuple[str, str], ...], prefix: str,
+                             footer: Tuple[str, str]) -> InlineKeyboardMarkup:
+    """Клавиатура со списком категорий (кэшируется по набору категорий, префиксу callback_data и нижней кнопке)"""
+    keyboard = [[InlineKeyboardButton(value, callback_data=f"{prefix}{key}")] for key, value in categories]
+    keyboard.append([InlineKeyboardButton(footer[0], callback_data=footer[1])])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def get_category_keyboard(user_categories: Dict[str, str], prefix: str = "category_",
+                          footer: Tuple[str, str] = _MANAGE_CATEGORIES_BUTTON) -> InlineKeyboardMarkup:
+    """Клавиатура выбора категории: пока категории пользователя не меняются, используется готовая"""
+    return _build_category_keyboard(tuple(user_categories.items()), prefix, footer)
+
+
 async def add_event_description(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение описания события"""
     # Сохраняем ID сообщения пользователя (если это не команда /skip)
@@ -2039,15 +2776,8 @@ async def add_event_description(update: Update, context: ContextTypes.DEFAULT_TY
         add_message_id(user_id, msg.message_id)
         return WAITING_CATEGORY
     
-    # Создаём клавиатуру с категориями пользователя
-    keyboard = []
-    for key, value in user_categories.items():
-        keyboard.append([InlineKeyboardButton(value, callback_data=f"category_{key}")])
-    
-    # Добавляем кнопку для управления категориями
-    keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Клавиатура с категориями пользователя и кнопкой управления категориями
+    reply_markup = get_category_keyboard(user_categories)
     
     msg = await update.message.reply_text(
         "Выберите <b>категорию</b> события:",
@@ -2066,17 +2796,9 @@ async def add_event_category(update: Update, context: ContextTypes.DEFAULT_TYPE)
     category = query.data.replace('category_', '')
     context.user_data['new_event']['category'] = category
     
-    # Создаём клавиатуру для выбора типа повторения
-    keyboard = [
-        [InlineKeyboardButton("Одноразовое", callback_data="repeat_once")],
-        [InlineKeyboardButton("Ежедневное", callback_data="repeat_daily")],
-        [InlineKeyboardButton("Еженедельное", callback_data="repeat_weekly")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     msg = await query.edit_message_text(
         "Выберите тип повторения:",
-        reply_markup=reply_markup
+        reply_markup=_REPEAT_TYPE_KEYBOARD
     )
     add_message_id(query.from_user.id, msg.message_id)
     return WAITING_REPEAT
@@ -2148,70 +2870,62 @@ async def finish_event_creation(query, context: ContextTypes.DEFAULT_TYPE):
     if event_title and not event_title.startswith('🕰'):
         base_event['title'] = '🕰 ' + event_title
     
+    # Время создания общее для всех событий серии; ID повторов различаются номером
+    created_now = datetime.now()
+    created_ts = created_now.timestamp()
+    created_iso = created_now.isoformat()
+    
     # Создаём события на основе типа повторения
     if repeat_type == 'once':
         # Одноразовое событие
         event = base_event.copy()
-        event['id'] = str(datetime.now().timestamp())
-        event['created_at'] = datetime.now().isoformat()
+        event['id'] = str(created_ts)
+        event['created_at'] = created_iso
         # Добавляем источник создания события
         event['source'] = 'schedule'
         # Инициализируем reminder_sent как пустой список
         if 'reminder_sent' not in event:
             event['reminder_sent'] = []
         save_user_event(user_id, event)
-    elif repeat_type == 'daily':
-        # Ежедневное событие - создаём события на неделю вперед
-        base_date = datetime.strptime(base_event['date'], '%Y-%m-%d')
-        for i in range(7):  # 7 дней = 1 неделя
-            event = base_event.copy()
-            event_date = base_date + timedelta(days=i)
-            event['date'] = event_date.strftime('%Y-%m-%d')
-            event['id'] = f"{datetime.now().timestamp()}_{i}"
-            event['created_at'] = datetime.now().isoformat()
-            event['repeat_type'] = 'daily'
-            event['base_date'] = base_event['date']
+    elif repeat_type in ('daily', 'weekly'):
+        # Ежедневное событие - 7 событий на неделю вперед, еженедельное - 4 события раз в неделю.
+        # Повторы хранятся отдельными записями, а не разворачиваются при чтении: каждый повтор
+        # редактируется и удаляется по своему ID, у него свои reminder_sent, а unified_bot.py
+        # и напоминания читают события пользователя как готовый список
+        count, step_days = (7, 1) if repeat_type == 'daily' else (4, 7)
+        base_date = parse_event_date(base_event['date'])
+        # Общие для всей серии поля собираются один раз, в цикле меняются только дата и ID
+        template = {
+            **base_event,
+            'created_at': created_iso,
+            'repeat_type': repeat_type,
+            'base_date': base_event['date'],
             # Добавляем источник создания события
-            event['source'] = 'schedule'
-            # Инициализируем reminder_sent как пустой список
-            if 'reminder_sent' not in event:
-                event['reminder_sent'] = []
-            save_user_event(user_id, event)
-    elif repeat_type == 'weekly':
-        # Еженедельное событие - создаём события на 4 недели вперед
-        base_date = datetime.strptime(base_event['date'], '%Y-%m-%d')
-        for i in range(4):  # 4 недели
-            event = base_event.copy()
-            event_date = base_date + timedelta(weeks=i)
-            event['date'] = event_date.strftime('%Y-%m-%d')
-            event['id'] = f"{datetime.now().timestamp()}_{i}"
-            event['created_at'] = datetime.now().isoformat()
-            event['repeat_type'] = 'weekly'
-            event['base_date'] = base_event['date']
-            # Добавляем источник создания события
-            event['source'] = 'schedule'
-            # Инициализируем reminder_sent как пустой список
-            if 'reminder_sent' not in event:
-                event['reminder_sent'] = []
-            save_user_event(user_id, event)
-    
-    # Удаляем все сообщения бота перед показом расписания
-    try:
-        await query.message.delete()
-    except:
-        pass
-    
-    deleted_count = await delete_user_messages(context, user_id, chat_id)
+            'source': 'schedule',
+        }
+        reminder_sent = base_event.get('reminder_sent', [])
+        series = [
+            {
+                **template,
+                'date': (base_date + timedelta(days=i * step_days)).isoformat(),
+                'id': f"{created_ts}_{i}",
+                # У каждого события свой список отправленных напоминаний
+                'reminder_sent': list(reminder_sent),
+            }
+            for i in range(count)
+        ]
+        # Вся серия сохраняется одной записью
+        add_user_events(user_id, series)
     
-    # Удаляем прошедшие события перед показом расписания
-    delete_past_events(user_id)
+    # Сообщения бота (вместе с текущим) удаляются в фоне, расписание показываем сразу
+    delete_user_messages_in_background(context, user_id, chat_id, (query.message.message_id,))
     
     # Показываем расписание на неделю
     events = get_user_events(user_id)
     if events:
         text = format_events_list(events, 'week', str(user_id))
     else:
-        text = "Может устроить день дурака?"
+        text = NO_EVENTS_TEXT
     
     # Всегда показываем основную клавиатуру
     main_keyboard = get_main_keyboard()
@@ -2241,20 +2955,18 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def list_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать все события"""
     user_id = update.effective_user.id
-    # Удаляем прошедшие события перед показом
-    delete_past_events(user_id)
     events = get_user_events(user_id)
     
     if not events:
         keyboard = get_main_keyboard()
         msg = await update.message.reply_text(
-            "Может устроить день дурака?",
+            NO_EVENTS_TEXT,
             reply_markup=keyboard
         )
         add_message_id(user_id, msg.message_id)
         return
     
-    text = format_events_list(events, 'all', str(user_id))
+    text = format_events_list(events, 'upcoming', str(user_id))
     keyboard = get_main_keyboard()
     msg = await update.message.reply_text(
         text, 
@@ -2280,8 +2992,6 @@ async def today_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user_id = update.effective_user.id
-    # Удаляем прошедшие события перед показом
-    delete_past_events(user_id)
     events = get_user_events(user_id)
     text = format_events_list(events, 'today', str(user_id))
     keyboard = get_main_keyboard()
@@ -2296,12 +3006,8 @@ async def today_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def week_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать все события (полное расписание)"""
     user_id = update.effective_user.id
-    # Удаляем прошедшие события перед показом (принудительно)
-    deleted = delete_past_events(str(user_id))
-    if deleted > 0:
-        logger.info(f"🗑️  Удалено {deleted} прошедших событий для пользователя {user_id} перед показом общего расписания")
     events = get_user_events(user_id)
-    text = format_events_list(events, 'all', str(user_id))
+    text = format_events_list(events, 'upcoming', str(user_id))
     keyboard = get_main_keyboard()
     msg = await update.message.reply_text(
         text, 
@@ -2327,39 +3033,11 @@ async def tomorrow_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user_id = update.effective_user.id
-    # Удаляем прошедшие события перед показом
-    delete_past_events(user_id)
-    events = get_user_events(user_id)
-    
-    # Получаем текущее время в часовом поясе пользователя
-    user_timezone = get_user_timezone(str(user_id))
-    if user_timezone:
-        try:
-            tz = ZoneInfo(user_timezone)
-            now = datetime.now(tz)
-        except Exception as e:
-            logger.warning(f"⚠️  Ошибка при получении часового пояса {user_timezone}: {e}")
-            now = datetime.now()
-    else:
-        now = datetime.now()
-    
-    # Получаем дату завтра в часовом поясе пользователя
-    if now.tzinfo is not None:
-        tomorrow_date = (now + timedelta(days=1)).date()
-    else:
-        tomorrow_date = (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).date()
-    
-    # Фильтруем события на завтра (сравниваем naive даты)
-    tomorrow_events_list = [
-        e for e in events 
-        if datetime.strptime(e['date'], '%Y-%m-%d').date() == tomorrow_date
-    ]
     
-    if tomorrow_events_list:
-        # Используем форматирование для одного дня
-        text = format_events_list(tomorrow_events_list, 'tomorrow', str(user_id))
-    else:
-        text = "Может устроить день дурака?"
+    # Завтрашний день в часовом поясе пользователя вырезается из отсортированного индекса внутри
+    # format_events_list (без разбора дат и сортировки), как и для "сегодня"
+    events = get_user_events(user_id)
+    text = format_events_list(events, 'tomorrow', str(user_id))
     
     keyboard = get_main_keyboard()
     msg = await update.message.reply_text(
@@ -2374,16 +3052,9 @@ async def delete_all_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запрос подтверждения удаления расписания"""
     user_id = update.effective_user.id
     
-    # Создаём клавиатуру с подтверждением
-    keyboard = [
-        [InlineKeyboardButton("Да", callback_data="confirm_delete_yes")],
-        [InlineKeyboardButton("Нет", callback_data="confirm_delete_no")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     msg = await update.message.reply_text(
         "Точно удалить расписание?",
-        reply_markup=reply_markup
+        reply_markup=_CONFIRM_DELETE_KEYBOARD
     )
     add_message_id(user_id, msg.message_id)
 
@@ -2417,38 +3088,51 @@ async def confirm_delete_yes(update: Update, context: ContextTypes.DEFAULT_TYPE)
         add_message_id(user_id, msg.message_id)
 
 
-async def confirm_delete_no(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отмена удаления расписания"""
-    query = update.callback_query
-    await query.answer()
-    
-    user_id = query.from_user.id
-    events = get_user_events(user_id)
+# Готовые клавиатуры меню редактирования: user_id -> (индекс событий, по которому построена, клавиатура)
+_edit_keyboard_cache: Dict[str, Tuple[List[Tuple[date, str, Dict]], InlineKeyboardMarkup]] = {}
+
+
+def get_edit_events_keyboard(user_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура меню редактирования: первые 20 событий по дате и времени и кнопки управления.
+    Строится заново, только когда пересобран отсортированный индекс событий (т.е. после изменений)"""
+    user_id_str = str(user_id)
+    _, entries = get_sorted_user_events(user_id_str)
+    cached = _edit_keyboard_cache.get(user_id_str)
+    if cached is not None and cached[0] is entries:
+        return cached[1]
     
-    # Возвращаемся к меню редактирования
     keyboard = []
-    if events:
-        events_sorted = sorted(events, key=lambda x: (x['date'], x['time']))[:20]
-        for event in events_sorted:
-            date_obj = datetime.strptime(event['date'], '%Y-%m-%d')
-            date_str = date_obj.strftime('%d.%m')
-            title_short = event['title'][:25] + '...' if len(event['title']) > 25 else event['title']
-            button_text = f"{date_str} {event['time']} - {title_short}"
-            keyboard.append([
-                InlineKeyboardButton(
-                    button_text,
-                    callback_data=f"event_{event['id']}"
-                )
-            ])
+    for date_obj, time_str, event in entries[:20]:  # Максимум 20
+        title = event['title']
+        title_short = title[:25] + '...' if len(title) > 25 else title
+        keyboard.append([
+            InlineKeyboardButton(
+                f"{date_obj.strftime('%d.%m')} {time_str} - {title_short}",
+                callback_data=f"event_{event['id']}"
+            )
+        ])
     
     keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
     keyboard.append([InlineKeyboardButton("удалить расписание", callback_data="confirm_delete_start")])
     keyboard.append([InlineKeyboardButton("инструкция", callback_data="show_help")])
     keyboard.append([InlineKeyboardButton("назад", callback_data="back_to_main")])
     reply_markup = InlineKeyboardMarkup(keyboard)
+    _edit_keyboard_cache[user_id_str] = (entries, reply_markup)
+    return reply_markup
+
+
+async def confirm_delete_no(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмена удаления расписания"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = query.from_user.id
+    
+    # Возвращаемся к меню редактирования
+    reply_markup = get_edit_events_keyboard(user_id)
     
     await query.edit_message_text(
-        "Удаление отменено.\n\nВыберите событие для редактирования:",
+        f"Удаление отменено.\n\n{SELECT_EVENT_TO_EDIT_TEXT}",
         reply_markup=reply_markup
     )
 
@@ -2458,16 +3142,9 @@ async def confirm_delete_start(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    # Создаём клавиатуру с подтверждением
-    keyboard = [
-        [InlineKeyboardButton("Да", callback_data="confirm_delete_yes")],
-        [InlineKeyboardButton("Нет", callback_data="confirm_delete_no")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
         "Точно удалить расписание?",
-        reply_markup=reply_markup
+        reply_markup=_CONFIRM_DELETE_KEYBOARD
     )
 
 
@@ -2477,158 +3154,102 @@ async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.from_user.id
-    events = get_user_events(user_id)
-    
-    help_text = """
-📖 <b>Справка по использованию бота:</b>
-
-<b>Основные кнопки:</b>
-➕ - Добавить новое событие
-моё расписание - Показать все события
-что сегодня? - События на сегодня
-что завтра? - События на завтра
-✏️ - Редактировать события и управлять категориями
-🙈 - Очистить чат
-
-<b>Добавление события:</b>
-1. Нажмите ➕
-2. Введите название события
-3. Введите дату:
-   • завтра, послезавтра
-   • понедельник, вторник, среда и т.д.
-   • 17 января, 19 01, 25.12.2024
-4. Введите время:
-   • Только часы: 12, 13, 9
-   • С минутами: 12:30, 14:45
-5. Введите описание (или /skip)
-6. Выберите категорию (или создайте свою)
-7. Выберите повторяемость
-8. Выберите напоминание
-
-<b>Категории:</b>
-Каждый пользователь создает свои категории.
-Нажмите ✏️ → "управление категориями" для настройки.
-
-<b>Редактирование:</b>
-Нажмите ✏️ и выберите событие для редактирования.
-
-<b>Удаление:</b>
-В меню редактирования можно удалить отдельное событие или всё расписание.
-"""
     
     # Создаём клавиатуру для возврата
-    keyboard = []
-    if events:
-        events_sorted = sorted(events, key=lambda x: (x['date'], x['time']))[:20]
-        for event in events_sorted:
-            date_obj = datetime.strptime(event['date'], '%Y-%m-%d')
-            date_str = date_obj.strftime('%d.%m')
-            title_short = event['title'][:25] + '...' if len(event['title']) > 25 else event['title']
-            button_text = f"{date_str} {event['time']} - {title_short}"
-            keyboard.append([
-                InlineKeyboardButton(
-                    button_text,
-                    callback_data=f"event_{event['id']}"
-                )
-            ])
-    
-    keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
-    keyboard.append([InlineKeyboardButton("удалить расписание", callback_data="confirm_delete_start")])
-    keyboard.append([InlineKeyboardButton("инструкция", callback_data="show_help")])
-    keyboard.append([InlineKeyboardButton("назад", callback_data="back_to_main")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = get_edit_events_keyboard(user_id)
     
-    await query.edit_message_text(help_text, reply_markup=reply_markup, parse_mode='HTML')
+    await query.edit_message_text(HELP_TEXT, reply_markup=reply_markup, parse_mode='HTML')
 
 
-async def clear_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Очистка истории сообщений - удаляет все сообщения выше (кроме закрепленного)"""
-    user_id = update.effective_user.id
-    chat_id = update.effective_chat.id
-    current_message_id = update.message.message_id
-    
-    # Получаем информацию о чате для проверки закрепленного сообщения
-    pinned_message_id = None
+# Закрепленные сообщения чатов: chat_id -> (ID закрепленного сообщения или None, время проверки)
+_pinned_cache: Dict[int, Tuple[Optional[int], float]] = {}
+
+
+async def get_pinned_message_id(bot, chat_id: int) -> Optional[int]:
+    """ID закрепленного сообщения чата (get_chat - не чаще раза в PINNED_CACHE_TTL секунд)"""
+    now = time.monotonic()
+    cached = _pinned_cache.get(chat_id)
+    if cached is not None and now - cached[1] < PINNED_CACHE_TTL:
+        return cached[0]
     try:
-        chat = await context.bot.get_chat(chat_id)
-        if hasattr(chat, 'pinned_message') and chat.pinned_message:
-            pinned_message_id = chat.pinned_message.message_id
-    except:
-        # Если не удалось получить информацию о чате, продолжаем без проверки закрепленного
-        pass
-    
-    # Функция для параллельного удаления сообщений
-    async def delete_message_safe(msg_id: int) -> bool:
-        """Безопасное удаление сообщения с обработкой ошибок"""
-        if pinned_message_id and msg_id == pinned_message_id:
-            return False
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
-            return True
-        except Exception:
-            return False
-    
-    # Собираем все ID сообщений для удаления
-    messages_to_delete = []
-    messages_data = load_user_sent_messages()
+        chat = await bot.get_chat(chat_id)
+    except TelegramError:
+        # Если не удалось получить информацию о чате, используем последнее известное значение
+        return cached[0] if cached is not None else None
+    pinned_message_id = chat.pinned_message.message_id if chat.pinned_message else None
+    _pinned_cache[chat_id] = (pinned_message_id, now)
+    return pinned_message_id
+
+
+async def track_pinned_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обновление кэша по служебному сообщению о закреплении, чтобы новое закрепленное не удалилось"""
+    message = update.effective_message
+    if message and message.pinned_message:
+        _pinned_cache[message.chat_id] = (message.pinned_message.message_id, time.monotonic())
+
+
+async def clear_chat_history(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id: int, anchor_message_id: int):
+    """Удаление сообщений выше anchor_message_id и его самого (кроме закрепленного).
+    Списки ID очищаются сразу (без await между чтением и сохранением), а само удаление идет в фоне,
+    поэтому долгая очистка не задерживает обработку следующих обновлений"""
+    # Закрепленное сообщение не удаляем
+    pinned_message_id = await get_pinned_message_id(context.bot, chat_id)
+    
+    # Собираем все ID сообщений для удаления (множество - без повторов)
+    to_delete: Set[int] = set()
+    messages_data = get_user_sent_messages_data()
     user_id_str = str(user_id)
     
-    if user_id_str in messages_data:
-        message_ids = messages_data[user_id_str]
+    # Списки без сообщений выше anchor_message_id не меняются и не перезаписываются
+    message_ids = messages_data.get(user_id_str)
+    if message_ids:
         remaining_messages = []
         for msg_id in message_ids:
             if pinned_message_id and msg_id == pinned_message_id:
                 remaining_messages.append(msg_id)
                 continue
-            if msg_id < current_message_id:
-                messages_to_delete.append(msg_id)
+            if msg_id < anchor_message_id:
+                to_delete.add(msg_id)
             else:
                 remaining_messages.append(msg_id)
         
-        messages_data[user_id_str] = remaining_messages
-        save_user_sent_messages(messages_data)
+        if len(remaining_messages) != len(message_ids):
+            messages_data[user_id_str] = remaining_messages
+            save_user_sent_messages(messages_data)
     
-    # Удаляем все сообщения бота выше текущего
-    bot_messages_data = load_messages()
+    # Удаляем все сообщения бота выше anchor_message_id
+    bot_messages_data = get_messages_data()
     
-    if user_id_str in bot_messages_data:
-        message_ids = bot_messages_data[user_id_str]
+    message_ids = bot_messages_data.get(user_id_str)
+    if message_ids:
         remaining_bot_messages = []
         for msg_id in message_ids:
-            if msg_id < current_message_id:
-                if msg_id not in messages_to_delete:
-                    messages_to_delete.append(msg_id)
+            if msg_id < anchor_message_id:
+                to_delete.add(msg_id)
             else:
                 remaining_bot_messages.append(msg_id)
         
-        bot_messages_data[user_id_str] = remaining_bot_messages
-        save_messages(bot_messages_data)
+        if len(remaining_bot_messages) != len(message_ids):
+            bot_messages_data[user_id_str] = remaining_bot_messages
+            save_messages(bot_messages_data)
     
     # Добавляем дополнительные сообщения для удаления (массовое удаление)
-    start_id = max(1, current_message_id - 100)
-    for msg_id in range(start_id, current_message_id):
-        if msg_id not in messages_to_delete:
-            messages_to_delete.append(msg_id)
+    start_id = max(1, anchor_message_id - 100)
+    to_delete.update(range(start_id, anchor_message_id + 1))
     
-    # Параллельное удаление батчами по 10 сообщений
-    deleted_count = 0
-    batch_size = 10
-    for i in range(0, len(messages_to_delete), batch_size):
-        batch = messages_to_delete[i:i + batch_size]
-        tasks = [delete_message_safe(msg_id) for msg_id in batch]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        deleted_count += sum(1 for r in results if r is True)
-        # Небольшая задержка между батчами для избежания rate limit
-        if i + batch_size < len(messages_to_delete):
-            await asyncio.sleep(0.01)
-    
-    # Пытаемся удалить сообщение команды /clear (если бот имеет права)
-    try:
-        await update.message.delete()
-        deleted_count += 1
-    except:
-        # Если не удалось удалить сообщение команды, продолжаем
-        pass
+    # Удаляем пачками через deleteMessages вместе с самим anchor_message_id (закрепленное пропускаем).
+    # Новые сообщения получат ID больше anchor_message_id и не попадут под удаление
+    to_delete.discard(pinned_message_id)
+    run_in_background(delete_messages_bulk(context.bot, chat_id, sorted(to_delete)))
+
+
+async def clear_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Очистка истории сообщений - удаляет все сообщения выше (кроме закрепленного)"""
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    current_message_id = update.message.message_id
+    
+    await clear_chat_history(context, user_id, chat_id, current_message_id)
     
     # Отправляем команду /start вместо расписания
     await start(update, context)
@@ -2641,42 +3262,18 @@ async def edit_events_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if not events:
         # Если нет событий, показываем меню с кнопкой управления категориями
-        keyboard = [
-            [InlineKeyboardButton("управление категориями", callback_data="manage_categories")],
-            [InlineKeyboardButton("назад", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         msg = await update.message.reply_text(
             "Нет событий для редактирования.",
-            reply_markup=reply_markup
+            reply_markup=_NO_EVENTS_EDIT_KEYBOARD
         )
         add_message_id(user_id, msg.message_id)
         return
     
     # Создаём клавиатуру с событиями для редактирования
-    keyboard = []
-    events_sorted = sorted(events, key=lambda x: (x['date'], x['time']))[:20]  # Максимум 20
-    
-    for event in events_sorted:
-        date_obj = datetime.strptime(event['date'], '%Y-%m-%d')
-        date_str = date_obj.strftime('%d.%m')
-        title_short = event['title'][:25] + '...' if len(event['title']) > 25 else event['title']
-        button_text = f"{date_str} {event['time']} - {title_short}"
-        keyboard.append([
-            InlineKeyboardButton(
-                button_text,
-                callback_data=f"event_{event['id']}"
-            )
-        ])
-    
-    keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
-    keyboard.append([InlineKeyboardButton("удалить расписание", callback_data="confirm_delete_start")])
-    keyboard.append([InlineKeyboardButton("инструкция", callback_data="show_help")])
-    keyboard.append([InlineKeyboardButton("назад", callback_data="back_to_main")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = get_edit_events_keyboard(user_id)
     
     msg = await update.message.reply_text(
-        "Выберите событие для редактирования:",
+        SELECT_EVENT_TO_EDIT_TEXT,
         reply_markup=reply_markup,
         parse_mode='HTML'
     )
@@ -2691,7 +3288,7 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     events = get_user_events(user_id)
     
-    text = format_events_list(events, 'all', str(user_id)) if events else "Может устроить день дурака?"
+    text = format_events_list(events, 'all', str(user_id)) if events else NO_EVENTS_TEXT
     keyboard = get_main_keyboard()
     
     await query.edit_message_text(text, parse_mode='HTML')
@@ -2711,95 +3308,14 @@ async def clear_chat_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     chat_id = query.message.chat_id
     current_message_id = query.message.message_id
     
-    # Получаем информацию о чате для проверки закрепленного сообщения
-    pinned_message_id = None
-    try:
-        chat = await context.bot.get_chat(chat_id)
-        if hasattr(chat, 'pinned_message') and chat.pinned_message:
-            pinned_message_id = chat.pinned_message.message_id
-    except:
-        # Если не удалось получить информацию о чате, продолжаем без проверки закрепленного
-        pass
-    
-    # Функция для параллельного удаления сообщений
-    async def delete_message_safe(msg_id: int) -> bool:
-        """Безопасное удаление сообщения с обработкой ошибок"""
-        if pinned_message_id and msg_id == pinned_message_id:
-            return False
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
-            return True
-        except Exception:
-            return False
-    
-    # Собираем все ID сообщений для удаления
-    messages_to_delete = []
-    messages_data = load_user_sent_messages()
-    user_id_str = str(user_id)
-    
-    if user_id_str in messages_data:
-        message_ids = messages_data[user_id_str]
-        remaining_messages = []
-        for msg_id in message_ids:
-            if pinned_message_id and msg_id == pinned_message_id:
-                remaining_messages.append(msg_id)
-                continue
-            if msg_id < current_message_id:
-                messages_to_delete.append(msg_id)
-            else:
-                remaining_messages.append(msg_id)
-        
-        messages_data[user_id_str] = remaining_messages
-        save_user_sent_messages(messages_data)
-    
-    # Удаляем все сообщения бота выше текущего
-    bot_messages_data = load_messages()
-    
-    if user_id_str in bot_messages_data:
-        message_ids = bot_messages_data[user_id_str]
-        remaining_bot_messages = []
-        for msg_id in message_ids:
-            if msg_id < current_message_id:
-                if msg_id not in messages_to_delete:
-                    messages_to_delete.append(msg_id)
-            else:
-                remaining_bot_messages.append(msg_id)
-        
-        bot_messages_data[user_id_str] = remaining_bot_messages
-        save_messages(bot_messages_data)
-    
-    # Добавляем дополнительные сообщения для удаления (массовое удаление)
-    start_id = max(1, current_message_id - 100)
-    for msg_id in range(start_id, current_message_id):
-        if msg_id not in messages_to_delete:
-            messages_to_delete.append(msg_id)
-    
-    # Параллельное удаление батчами по 10 сообщений
-    deleted_count = 0
-    batch_size = 10
-    for i in range(0, len(messages_to_delete), batch_size):
-        batch = messages_to_delete[i:i + batch_size]
-        tasks = [delete_message_safe(msg_id) for msg_id in batch]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        deleted_count += sum(1 for r in results if r is True)
-        # Небольшая задержка между батчами для избежания rate limit
-        if i + batch_size < len(messages_to_delete):
-            await asyncio.sleep(0.01)
-    
-    # Пытаемся удалить текущее сообщение с кнопкой (если бот имеет права)
-    try:
-        await query.message.delete()
-        deleted_count += 1
-    except:
-        # Если не удалось удалить сообщение, продолжаем
-        pass
+    await clear_chat_history(context, user_id, chat_id, current_message_id)
     
     # Показываем только актуальное расписание (без дополнительных сообщений о количестве удаленных)
     events = get_user_events(user_id)
     if events:
         text = format_events_list(events, 'all', str(user_id))
     else:
-        text = "Может устроить день дурака?"
+        text = NO_EVENTS_TEXT
     
     # Всегда показываем основную клавиатуру
     main_keyboard = get_main_keyboard()
@@ -2819,12 +3335,10 @@ async def event_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     event_id = query.data.replace('event_', '')
     user_id = query.from_user.id
-    events = get_user_events(user_id)
-    
-    event = next((e for e in events if e.get('id') == event_id), None)
+    event = get_user_events_by_id(user_id).get(event_id)
     
     if not event:
-        await query.edit_message_text("Событие не найдено.")
+        await query.edit_message_text(EVENT_NOT_FOUND_TEXT)
         return
     
     # Клавиатура для управления событием
@@ -2875,12 +3389,10 @@ async def edit_event_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     event_id = query.data.replace('edit_', '')
     user_id = query.from_user.id
-    events = get_user_events(user_id)
-    
-    event = next((e for e in events if e.get('id') == event_id), None)
+    event = get_user_events_by_id(user_id).get(event_id)
     
     if not event:
-        await query.edit_message_text("Событие не найдено.")
+        await query.edit_message_text(EVENT_NOT_FOUND_TEXT)
         return
     
     context.user_data['editing_event_id'] = event_id
@@ -2923,14 +3435,7 @@ async def edit_field_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = query.from_user.id
         user_categories = get_user_categories(user_id)
         
-        keyboard = []
-        for key, value in user_categories.items():
-            keyboard.append([InlineKeyboardButton(value, callback_data=f"cat_{key}")])
-        
-        # Добавляем кнопку для управления категориями
-        keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = get_category_keyboard(user_categories, prefix="cat_")
         await query.edit_message_text(
             f"{prompts[field]}",
             reply_markup=reply_markup
@@ -2950,11 +3455,10 @@ async def edit_field_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     event_id = context.user_data.get('editing_event_id')
     user_id = update.effective_user.id
     
-    events = get_user_events(user_id)
-    event = next((e for e in events if e.get('id') == event_id), None)
+    event = get_user_events_by_id(user_id).get(event_id)
     
     if not event:
-        await update.message.reply_text("Событие не найдено.")
+        await update.message.reply_text(EVENT_NOT_FOUND_TEXT)
         context.user_data.clear()
         return ConversationHandler.END
     
@@ -2969,9 +3473,19 @@ async def edit_field_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             date_str = update.message.text.strip()
             date_obj = None
+            # Начало текущих суток - одно на все проверки ниже
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            
+            # Дата уже в формате ГГГГ-ММ-ДД - разбираем сразу, без остальных вариантов
+            if _DATE_RE.match(date_str):
+                try:
+                    date_obj = datetime.fromisoformat(date_str)
+                except ValueError:
+                    pass
             
-            # Сначала пробуем парсить естественные формулировки
-            date_obj = parse_natural_date(date_str)
+            # Пробуем парсить естественные формулировки
+            if date_obj is None:
+                date_obj = parse_natural_date(date_str)
             
             # Если не получилось, пробуем формат DD MM (без года)
             if date_obj is None:
@@ -2981,22 +3495,16 @@ async def edit_field_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         day = int(parts[0])
                         month = int(parts[1])
                         if 1 <= month <= 12 and 1 <= day <= 31:
-                            current_year = datetime.now().year
-                            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+                            current_year = today.year
                             date_obj = datetime(current_year, month, day)
                             if date_obj < today:
                                 date_obj = datetime(current_year + 1, month, day)
                     except ValueError:
                         pass
             
-            # Если все еще не получилось, пробуем стандартные форматы
+            # Если все еще не получилось, пробуем числовые форматы (одно регулярное выражение вместо перебора strptime)
             if date_obj is None:
-                for fmt in ['%d.%m.%Y', '%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d.%m.%y', '%d/%m/%y']:
-                    try:
-                        date_obj = datetime.strptime(date_str, fmt)
-                        break
-                    except ValueError:
-                        continue
+                date_obj = parse_numeric_date(date_str, today)
             
             if date_obj is None:
                 msg = await update.message.reply_text(
@@ -3008,7 +3516,6 @@ async def edit_field_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return WAITING_EDIT_VALUE
             
             # Проверяем, что дата не в прошлом
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
             if date_obj.date() < today.date():
                 msg = await update.message.reply_text(
                     "Нельзя выбрать прошедшую дату. Попробуйте снова.",
@@ -3017,7 +3524,7 @@ async def edit_field_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 add_message_id(user_id, msg.message_id)
                 return WAITING_EDIT_VALUE
             
-            event['date'] = date_obj.strftime('%Y-%m-%d')
+            event['date'] = date_obj.date().isoformat()
         except Exception as e:
             msg = await update.message.reply_text("Ошибка при обработке даты.")
             add_message_id(user_id, msg.message_id)
@@ -3040,10 +3547,10 @@ async def edit_field_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     time_str = time_str.replace(' ', ':')
                 
                 # Проверяем формат времени
-                datetime.strptime(time_str, '%H:%M')
+                time_str = normalize_time_input(time_str)
                 # Сохраняем в стандартном формате ЧЧ:ММ
                 event['time'] = time_str
-        except:
+        except ValueError:
             await update.message.reply_text(
                 "Неверный формат времени. Попробуйте снова:\n"
                 "• Только часы: 12, 13, 9\n"
@@ -3058,9 +3565,9 @@ async def edit_field_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     update_user_event(user_id, event_id, event)
     
-    # Удаляем все сообщения бота перед показом расписания
+    # Сообщения бота удаляются в фоне, расписание показываем сразу
     chat_id = update.effective_chat.id
-    deleted_count = await delete_user_messages(context, user_id, chat_id)
+    delete_user_messages_in_background(context, user_id, chat_id)
     
     # Показываем расписание на неделю
     await show_week_schedule(context, user_id, chat_id)
@@ -3079,20 +3586,14 @@ async def edit_category_callback(update: Update, context: ContextTypes.DEFAULT_T
     user_id = query.from_user.id
     chat_id = query.message.chat_id
     
-    events = get_user_events(user_id)
-    event = next((e for e in events if e.get('id') == event_id), None)
+    event = get_user_events_by_id(user_id).get(event_id)
     
     if event:
         event['category'] = category
         update_user_event(user_id, event_id, event)
         
-        # Удаляем все сообщения бота перед показом расписания
-        try:
-            await query.message.delete()
-        except:
-            pass
-        
-        deleted_count = await delete_user_messages(context, user_id, chat_id)
+        # Сообщения бота (вместе с текущим) удаляются в фоне одной пачкой, расписание показываем сразу
+        delete_user_messages_in_background(context, user_id, chat_id, (query.message.message_id,))
         
         # Показываем расписание на неделю
         await show_week_schedule(context, user_id, chat_id)
@@ -3121,13 +3622,19 @@ async def back_to_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text=" ",
             reply_markup=main_keyboard
         )
-    except:
+    except TelegramError:
         pass
     
     context.user_data.clear()
     return ConversationHandler.END
 
 
+def format_categories_text(user_categories: Dict[str, str]) -> str:
+    """Текст меню управления категориями со списком категорий пользователя"""
+    body = "\n".join(f"• {cat_name}" for cat_name in user_categories.values()) or "Категорий пока нет."
+    return f"📋 <b>Ваши категории:</b>\n\n{body}\n\nВыберите действие:"
+
+
 async def manage_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Меню управления категориями"""
     query = update.callback_query
@@ -3139,31 +3646,13 @@ async def manage_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_categories = get_user_categories(user_id)
     
-    # Формируем список категорий
-    categories_text = "📋 <b>Ваши категории:</b>\n\n"
-    if user_categories:
-        for cat_id, cat_name in user_categories.items():
-            categories_text += f"• {cat_name}\n"
-    else:
-        categories_text += "Категорий пока нет.\n"
-    
-    categories_text += "\nВыберите действие:"
+    categories_text = format_categories_text(user_categories)
     
-    keyboard = [
-        [InlineKeyboardButton("➕ Добавить категорию", callback_data="category_add")],
-        [InlineKeyboardButton("✏️ Редактировать категорию", callback_data="category_edit_list")],
-        [InlineKeyboardButton("🗑️ Удалить категорию", callback_data="category_delete_list")],
-    ]
-    
-    # Если это callback из процесса добавления события, добавляем кнопку "Дальше" и "Назад"
+    # Из процесса добавления события "Назад" возвращает к выбору категории
     if 'new_event' in context.user_data:
-        keyboard.append([InlineKeyboardButton("➡️ Дальше", callback_data="categories_done")])
-        keyboard.append([InlineKeyboardButton("◀️ Назад к выбору категории", callback_data="back_to_category_selection")])
+        reply_markup = _MANAGE_CATEGORIES_NEW_EVENT_KEYBOARD
     else:
-        keyboard.append([InlineKeyboardButton("➡️ Дальше", callback_data="categories_done")])
-        keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _MANAGE_CATEGORIES_KEYBOARD
     
     if query:
         await query.edit_message_text(categories_text, reply_markup=reply_markup, parse_mode='HTML')
@@ -3212,7 +3701,7 @@ async def category_add_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Удаляем сообщение пользователя
     try:
         await update.message.delete()
-    except:
+    except TelegramError:
         pass
     
     # Проверяем, откуда пришли (из добавления события или из меню)
@@ -3221,15 +3710,8 @@ async def category_add_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Получаем категории пользователя
         user_categories = get_user_categories(user_id)
         
-        # Создаём клавиатуру с категориями пользователя
-        keyboard = []
-        for key, value in user_categories.items():
-            keyboard.append([InlineKeyboardButton(value, callback_data=f"category_{key}")])
-        
-        # Добавляем кнопку для управления категориями
-        keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Клавиатура с категориями пользователя и кнопкой управления категориями
+        reply_markup = get_category_keyboard(user_categories)
         
         msg = await context.bot.send_message(
             chat_id=update.effective_chat.id,
@@ -3244,25 +3726,12 @@ async def category_add_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Создаем временное сообщение для обновления
         user_categories = get_user_categories(user_id)
         
-        categories_text = f"✅ Категория <b>«{category_name}»</b> добавлена!\n\n📋 <b>Ваши категории:</b>\n\n"
-        for cat_id, cat_name in user_categories.items():
-            categories_text += f"• {cat_name}\n"
-        
-        categories_text += "\nВыберите действие:"
-        
-        keyboard = [
-            [InlineKeyboardButton("➕ Добавить категорию", callback_data="category_add")],
-            [InlineKeyboardButton("✏️ Редактировать категорию", callback_data="category_edit_list")],
-            [InlineKeyboardButton("🗑️ Удалить категорию", callback_data="category_delete_list")],
-            [InlineKeyboardButton("➡️ Дальше", callback_data="categories_done")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        categories_text = f"✅ Категория <b>«{category_name}»</b> добавлена!\n\n{format_categories_text(user_categories)}"
         
         msg = await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=categories_text,
-            reply_markup=reply_markup,
+            reply_markup=_MANAGE_CATEGORIES_KEYBOARD,
             parse_mode='HTML'
         )
         add_message_id(user_id, msg.message_id)
@@ -3286,12 +3755,7 @@ async def category_edit_list(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return ConversationHandler.END
     
-    keyboard = []
-    for cat_id, cat_name in user_categories.items():
-        keyboard.append([InlineKeyboardButton(cat_name, callback_data=f"category_edit_{cat_id}")])
-    
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="manage_categories")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = get_category_keyboard(user_categories, prefix="category_edit_", footer=_BACK_TO_CATEGORIES_BUTTON)
     
     await query.edit_message_text(
         "Выберите категорию для редактирования:",
@@ -3360,12 +3824,7 @@ async def category_delete_list(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return ConversationHandler.END
     
-    keyboard = []
-    for cat_id, cat_name in user_categories.items():
-        keyboard.append([InlineKeyboardButton(cat_name, callback_data=f"category_delete_{cat_id}")])
-    
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="manage_categories")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = get_category_keyboard(user_categories, prefix="category_delete_", footer=_BACK_TO_CATEGORIES_BUTTON)
     
     await query.edit_message_text(
         "Выберите категорию для удаления:\n\n⚠️ Все события с этой категорией будут переведены в категорию 'остальное'.",
@@ -3410,26 +3869,24 @@ async def category_delete_yes(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     # Получаем категорию "остальное" или создаем её
     user_categories = get_user_categories(user_id)
-    default_category_id = None
-    for cat_id, cat_name in user_categories.items():
-        if cat_name == 'остальное':
-            default_category_id = cat_id
-            break
-    
+    name_to_id = {cat_name: cat_id for cat_id, cat_name in user_categories.items()}
+    default_category_id = name_to_id.get('остальное')
     if not default_category_id:
         default_category_id = 'other'
         add_user_category(user_id, default_category_id, 'остальное')
     
-    # Переводим все события с удаляемой категорией в "остальное"
-    data = load_data()
+    # Переводим все события с удаляемой категорией в "остальное" за один проход;
+    # файл событий пишем, только если что-то изменилось
     user_id_str = str(user_id)
-    if user_id_str in data:
-        for event in data[user_id_str]:
-            if event.get('category') == category_id:
-                event['category'] = default_category_id
-        save_data(data)
-    
-    # Удаляем категорию
+    changed = False
+    for event in load_data().get(user_id_str, []):
+        if event.get('category') == category_id:
+            event['category'] = default_category_id
+            changed = True
+    if changed:
+        _save_user_events_file(user_id_str)
+    
+    # Удаляем категорию через delete_user_category: в unified_bot.py она заменена удалением проекта
     delete_user_category(user_id, category_id)
     
     # Возвращаемся в меню управления категориями
@@ -3462,15 +3919,8 @@ async def categories_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return WAITING_CATEGORY
         
-        # Создаём клавиатуру с категориями пользователя
-        keyboard = []
-        for key, value in user_categories.items():
-            keyboard.append([InlineKeyboardButton(value, callback_data=f"category_{key}")])
-        
-        # Добавляем кнопку для управления категориями
-        keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Клавиатура с категориями пользователя и кнопкой управления категориями
+        reply_markup = get_category_keyboard(user_categories)
         
         await query.edit_message_text(
             "Выберите <b>категорию</b> события:",
@@ -3507,15 +3957,8 @@ async def back_to_category_selection(update: Update, context: ContextTypes.DEFAU
         )
         return WAITING_CATEGORY
     
-    # Создаём клавиатуру с категориями пользователя
-    keyboard = []
-    for key, value in user_categories.items():
-        keyboard.append([InlineKeyboardButton(value, callback_data=f"category_{key}")])
-    
-    # Добавляем кнопку для управления категориями
-    keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Клавиатура с категориями пользователя и кнопкой управления категориями
+    reply_markup = get_category_keyboard(user_categories)
     
     await query.edit_message_text(
         "Выберите <b>категорию</b> события:",
@@ -3525,6 +3968,26 @@ async def back_to_category_selection(update: Update, context: ContextTypes.DEFAU
     return WAITING_CATEGORY
 
 
+# Кнопки главной клавиатуры: одно регулярное выражение вместо отдельного фильтра на каждую кнопку
+_MENU_BUTTONS_RE = re.compile(
+    r'^(?:(?P<tomorrow>что завтра\?|завтра)|(?P<today>что сегодня\?|сегодня)|'
+    r'(?P<week>моё расписание)|(?P<edit>✏️)|(?P<clear>🙈))\s*$'
+)
+_MENU_BUTTON_HANDLERS = {
+    'tomorrow': tomorrow_events,
+    'today': today_events,
+    'week': week_events,
+    'edit': edit_events_list,
+    'clear': clear_messages,
+}
+
+
+async def menu_button_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка кнопок главной клавиатуры (совпадение уже найдено фильтром, берем его из context.matches)"""
+    handler = _MENU_BUTTON_HANDLERS[context.matches[0].lastgroup]
+    return await handler(update, context)
+
+
 def check_lock():
     """Проверка блокировки для предотвращения множественных запусков"""
     lock_path = os.path.join(os.path.dirname(__file__), LOCK_FILE)
@@ -3596,15 +4059,16 @@ def main():
         
         # Если токен не найден в переменных окружения, пытаемся загрузить из .env
         if not token:
+            # main() выполняется до запуска event loop, поэтому файл читается синхронно, одним вызовом
+            env_file = os.path.join(os.path.dirname(__file__), '.env')
             try:
-                env_file = os.path.join(os.path.dirname(__file__), '.env')
-                if os.path.exists(env_file):
-                    with open(env_file, 'r') as f:
-                        for line in f:
-                            if line.startswith('TELEGRAM_BOT_TOKEN='):
-                                token = line.split('=', 1)[1].strip().strip("'\"")
-                                break
-            except:
+                with open(env_file, 'r') as f:
+                    env = dict(
+                        line.split('=', 1) for line in f.read().splitlines()
+                        if '=' in line and not line.startswith('#')
+                    )
+                token = env.get('TELEGRAM_BOT_TOKEN', '').strip().strip("'\"")
+            except (OSError, UnicodeDecodeError):
                 pass
         
         if not token:
@@ -3635,7 +4099,26 @@ def main():
                 app.updater._network_loop_retry_delay = 2.0
                 logger.info("✅ Updater настроен с улучшенной обработкой ошибок")
         
-        application = Application.builder().token(token).post_init(post_init).build()
+        builder = (
+            Application.builder()
+            .token(token)
+            .connection_pool_size(BOT_API_CONNECTION_POOL)
+            .http_version('1.1')
+            .connect_timeout(BOT_API_CONNECT_TIMEOUT)
+            .read_timeout(BOT_API_READ_TIMEOUT)
+            .write_timeout(BOT_API_WRITE_TIMEOUT)
+            .pool_timeout(BOT_API_POOL_TIMEOUT)
+            .rate_limiter(BucketRateLimiter())
+            .post_init(post_init)
+        )
+        # parse_mode='HTML' намеренно передаётся в каждом вызове, а не через Defaults:
+        # эти же обработчики работают в unified_bot.py рядом с ботом задач,
+        # который отправляет пользовательский текст без разметки
+        if BOT_API_URL:
+            # Локальный сервер Bot API не ограничен общими лимитами api.telegram.org
+            builder = builder.base_url(f"{BOT_API_URL.rstrip('/')}/bot").base_file_url(f"{BOT_API_URL.rstrip('/')}/file/bot")
+            logger.info(f"🌐 Используется сервер Bot API: {BOT_API_URL}")
+        application = builder.build()
         global application_instance
         application_instance = application
         
@@ -3694,6 +4177,8 @@ def main():
         application.add_handler(CommandHandler('today', today_events))
         application.add_handler(CommandHandler('week', week_events))
         application.add_handler(CommandHandler('clear', clear_messages))
+        # Закрепление сообщения отслеживается отдельной группой, не мешая остальным обработчикам
+        application.add_handler(MessageHandler(filters.StatusUpdate.PINNED_MESSAGE, track_pinned_message), group=-1)
         # Команда /timezone обрабатывается через city_conv_handler
         
         # ConversationHandler для управления категориями
@@ -3761,11 +4246,7 @@ def main():
         # Обработчики кнопок клавиатуры (ПОСЛЕ ConversationHandler)
         # Используем более гибкие регулярные выражения для мобильной версии (учитываем возможные пробелы)
         # Эти обработчики будут срабатывать только если пользователь НЕ находится в ConversationHandler
-        application.add_handler(MessageHandler(filters.Regex('^(что завтра\\?|завтра)\s*$'), tomorrow_events))
-        application.add_handler(MessageHandler(filters.Regex('^(что сегодня\?|сегодня)\s*$'), today_events))
-        application.add_handler(MessageHandler(filters.Regex('^моё расписание\s*$'), week_events))
-        application.add_handler(MessageHandler(filters.Regex('^✏️\s*$'), edit_events_list))
-        application.add_handler(MessageHandler(filters.Regex('^🙈\s*$'), clear_messages))
+        application.add_handler(MessageHandler(filters.Regex(_MENU_BUTTONS_RE), menu_button_router))
         
         # Обработчики callback-кнопок
         application.add_handler(CallbackQueryHandler(event_callback, pattern='^event_'))
@@ -3850,7 +4331,7 @@ def main():
                     
                     # Получаем информацию о часовом поясе для отображения
                     try:
-                        tz = ZoneInfo(timezone_name)
+                        tz = get_zoneinfo(timezone_name)
                         now = datetime.now(tz)
                         offset = now.strftime('%z')
                         offset_formatted = f"{offset[:3]}:{offset[3:]}" if len(offset) >= 5 else offset
@@ -3917,12 +4398,12 @@ def main():
                 return
             
             # Определяем часовой пояс по городу
-            timezone_name = get_timezone_by_city(text)
+            timezone_name = await get_timezone_by_city(text)
             
             if timezone_name:
                 # Получаем информацию о часовом поясе для отображения
                 try:
-                    tz = ZoneInfo(timezone_name)
+                    tz = get_zoneinfo(timezone_name)
                     now = datetime.now(tz)
                     offset = now.strftime('%z')
                     offset_formatted = f"{offset[:3]}:{offset[3:]}" if len(offset) >= 5 else offset
@@ -4041,6 +4522,17 @@ def main():
             job_queue.run_repeating(health_check, interval=300, first=60)  # Проверка каждые 5 минут
         
         # Запуск бота с обработкой ошибок
+        # Загружаем события, категории и настройки в память один раз
+        load_data()
+        get_categories_data()
+        get_settings_data()
+        # Инициализируем геокодер заранее, чтобы первый запрос города не ждал загрузки данных
+        if GEOCODING_AVAILABLE:
+            try:
+                get_geocoding_tools()
+            except Exception as e:
+                logger.warning(f"⚠️  Не удалось инициализировать геокодер: {e}")
+        
         # Принудительная очистка прошедших событий при запуске
         deleted_on_startup = delete_past_events()
         if deleted_on_startup > 0:
@@ -4048,15 +4540,31 @@ def main():
         logger.info("🤖 Бот запущен и готов к работе!")
         
         try:
-            # Запускаем polling с автоматической очисткой pending updates
-            # drop_pending_updates=True автоматически очистит все pending updates при запуске
-            # Это также очистит webhook автоматически
-            application.run_polling(
-                allowed_updates=Update.ALL_TYPES,
-                drop_pending_updates=True,  # Автоматическая очистка при запуске
-                close_loop=False,  # Не закрываем event loop при ошибках
-                stop_signals=None  # Обрабатываем сигналы вручную
-            )
+            if WEBHOOK_URL:
+                # Webhook: Telegram сам присылает обновления, без циклических запросов getUpdates
+                webhook_path = WEBHOOK_PATH.strip('/')
+                logger.info(f"🌐 Запуск в режиме webhook на порту {WEBHOOK_PORT}")
+                application.run_webhook(
+                    listen='0.0.0.0',
+                    port=WEBHOOK_PORT,
+                    url_path=webhook_path,
+                    webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{webhook_path}",
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=True,
+                    close_loop=False,
+                    stop_signals=None
+                )
+            else:
+                # Запускаем polling с автоматической очисткой pending updates
+                # drop_pending_updates=True автоматически очистит все pending updates при запуске
+                # Это также очистит webhook автоматически
+                application.run_polling(
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=True,  # Автоматическая очистка при запуске
+                    close_loop=False,  # Не закрываем event loop при ошибках
+                    stop_signals=None  # Обрабатываем сигналы вручную
+                )
         except KeyboardInterrupt:
             logger.info("\n👋 Бот остановлен пользователем")
             shutdown_requested = True
@@ -4087,7 +4595,7 @@ def main():
             try:
                 # Сохраняем все данные перед завершением
                 logger.info("💾 Сохранение данных...")
-                # Данные уже сохраняются автоматически при каждом изменении
+                wait_for_pending_writes()
             except Exception as e:
                 logger.error(f"❌ Ошибка при сохранении данных: {e}")
             
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Скрипт для установки опциональных библиотек определения часового пояса по городу
+(geopy и tzfpy). Бот не устанавливает их сам при запуске.
+"""
+
+import subprocess
+import sys
+
+OPTIONAL_PACKAGES = ["geopy==2.4.1", "tzfpy>=0.15"]
+
+
+def main():
+    for package in OPTIONAL_PACKAGES:
+        print(f"📦 Установка {package}...")
+        try:
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "--quiet", package])
+        except subprocess.CalledProcessError as e:
+            print(f"❌ Не удалось установить {package}: {e}")
+            return 1
+    
+    try:
+        from geopy.geocoders import Nominatim
+        from tzfpy import get_tz
+    except ImportError as e:
+        print(f"⚠️  Библиотеки установлены, но не загружаются: {e}")
+        return 1
+    
+    print("✅ Библиотеки установлены. Перезапустите бота.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
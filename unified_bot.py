@@ -76,14 +76,34 @@ MODE_PLAN = "plan"
  WAITING_UNIFIED_REMINDER,
  WAITING_UNIFIED_TYPE) = range(100, 107)
 
+# Клавиатуры разделов неизменны: создаются один раз при загрузке модуля, а не на каждое сообщение
+_UNIFIED_MAIN_KEYBOARD = ReplyKeyboardMarkup([
+    [KeyboardButton("➕")],
+    [KeyboardButton("Проекты"), KeyboardButton("Статистика")],
+    [KeyboardButton("📋 План")]
+], resize_keyboard=True)
+
+_SCHEDULE_KEYBOARD = ReplyKeyboardMarkup([
+    [KeyboardButton("➕"), KeyboardButton("✏️")],
+    [KeyboardButton("🏠 Главное меню")]
+], resize_keyboard=True)
+
+_PLAN_KEYBOARD = ReplyKeyboardMarkup([
+    [KeyboardButton("📅 План на сегодня"), KeyboardButton("📅 План на завтра")],
+    [KeyboardButton("📅 План на неделю"), KeyboardButton("📅 План на месяц")],
+    [KeyboardButton("📅 План на год"), KeyboardButton("📅 План на 3 года")],
+    [KeyboardButton("✅ Управление задачами"), KeyboardButton("✏️ Редактировать события")],
+    [KeyboardButton("🏠 Главное меню")]
+], resize_keyboard=True)
+
+_TASKS_KEYBOARD = ReplyKeyboardMarkup([
+    [KeyboardButton("➕"), KeyboardButton("✏️")],
+    [KeyboardButton("🏠 Главное меню")]
+], resize_keyboard=True)
+
 def get_unified_main_keyboard():
     """Главное меню объединенного бота"""
-    keyboard = [
-        [KeyboardButton("➕")],
-        [KeyboardButton("Проекты"), KeyboardButton("Статистика")],
-        [KeyboardButton("📋 План")]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    return _UNIFIED_MAIN_KEYBOARD
 
 async def unified_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start для объединенного бота"""
@@ -112,10 +132,7 @@ async def unified_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def get_schedule_keyboard():
     """Клавиатура раздела расписания"""
-    return ReplyKeyboardMarkup([
-        [KeyboardButton("➕"), KeyboardButton("✏️")],
-        [KeyboardButton("🏠 Главное меню")]
-    ], resize_keyboard=True)
+    return _SCHEDULE_KEYBOARD
 
 async def switch_to_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Переключение в режим расписания"""
@@ -143,20 +160,11 @@ async def switch_to_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 def get_plan_keyboard():
     """Компактная клавиатура раздела плана"""
-    return ReplyKeyboardMarkup([
-        [KeyboardButton("📅 План на сегодня"), KeyboardButton("📅 План на завтра")],
-        [KeyboardButton("📅 План на неделю"), KeyboardButton("📅 План на месяц")],
-        [KeyboardButton("📅 План на год"), KeyboardButton("📅 План на 3 года")],
-        [KeyboardButton("✅ Управление задачами"), KeyboardButton("✏️ Редактировать события")],
-        [KeyboardButton("🏠 Главное меню")]
-    ], resize_keyboard=True)
+    return _PLAN_KEYBOARD
 
 def get_tasks_keyboard():
     """Клавиатура раздела задач"""
-    return ReplyKeyboardMarkup([
-        [KeyboardButton("➕"), KeyboardButton("✏️")],
-        [KeyboardButton("🏠 Главное меню")]
-    ], resize_keyboard=True)
+    return _TASKS_KEYBOARD
 
 async def switch_to_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Переключение в режим задач"""
@@ -1801,7 +1809,18 @@ def main():
         app.bot_data['schedule_module'] = schedule_module
         app.bot_data['tasks_module'] = tasks_module
         logger.info("Модули сохранены в bot_data")
-        
+
+        # Загружаем события, категории и настройки расписания в память до первого обновления,
+        # чтобы первый callback не читал файлы с диска
+        if schedule_module:
+            try:
+                for loader in ('load_data', 'get_categories_data', 'get_settings_data'):
+                    if hasattr(schedule_module, loader):
+                        getattr(schedule_module, loader)()
+                logger.info("✅ Данные расписания загружены в память")
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке данных расписания: {e}", exc_info=True)
+
         # Настраиваем фоновые задачи напоминаний
         try:
             job_queue = app.job_queue
@@ -1841,7 +1860,11 @@ def main():
     
     # Создаем приложение с поддержкой job_queue для напоминаний и post_init
     # job_queue включен по умолчанию в python-telegram-bot 20.x
-    application = Application.builder().token(token).post_init(post_init).build()
+    builder = Application.builder().token(token).post_init(post_init)
+    if schedule_module and hasattr(schedule_module, 'BucketRateLimiter'):
+        # Ограничение скорости запросов к Telegram до отправки (вместо ожидания после RetryAfter)
+        builder = builder.rate_limiter(schedule_module.BucketRateLimiter())
+    application = builder.build()
     
     # ВАЖНО: ConversationHandler должны быть зарегистрированы ПЕРВЫМИ!
     # Регистрируем обработчики из бота расписания (если модуль загружен)
@@ -1978,7 +2001,10 @@ def main():
                                                 event['category'] = 'other'
                                                 updated = True
                                         
-                                        if updated and hasattr(schedule_module, 'update_user_event'):
+                                        if updated and hasattr(schedule_module, 'save_user_events'):
+                                            # События изменены на месте - сохраняем файл пользователя один раз
+                                            schedule_module.save_user_events(str(user_id), events)
+                                        elif updated and hasattr(schedule_module, 'update_user_event'):
                                             # Сохраняем обновленные события через update_user_event
                                             for event in events:
                                                 if isinstance(event, dict) and event.get('category') == 'other' and 'id' in event:
@@ -2217,15 +2243,18 @@ def main():
                                 schedule_module.add_message_id(user_id, msg.message_id)
                             return WAITING_CATEGORY
                         
-                        # Создаём клавиатуру с категориями пользователя
-                        keyboard = []
-                        for key, value in user_categories.items():
-                            keyboard.append([InlineKeyboardButton(value, callback_data=f"category_{key}")])
-                        
-                        # Добавляем кнопку для управления категориями
-                        keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
-                        
-                        reply_markup = InlineKeyboardMarkup(keyboard)
+                        # Клавиатура с категориями пользователя (готовая из кэша schedule_bot, если доступна)
+                        if hasattr(schedule_module, 'get_category_keyboard'):
+                            reply_markup = schedule_module.get_category_keyboard(user_categories)
+                        else:
+                            keyboard = []
+                            for key, value in user_categories.items():
+                                keyboard.append([InlineKeyboardButton(value, callback_data=f"category_{key}")])
+                            
+                            # Добавляем кнопку для управления категориями
+                            keyboard.append([InlineKeyboardButton("управление категориями", callback_data="manage_categories")])
+                            
+                            reply_markup = InlineKeyboardMarkup(keyboard)
                         
                         msg = await update.message.reply_text(
                             "Выберите <b>категорию</b> события:",
@@ -2634,6 +2663,12 @@ def main():
                     'clear',
                     create_schedule_wrapper(schedule_module.clear_messages)
                 ))
+            if hasattr(schedule_module, 'track_pinned_message'):
+                # Кэш закрепленных сообщений обновляется в любом режиме, отдельной группой
+                application.add_handler(MessageHandler(
+                    filters.StatusUpdate.PINNED_MESSAGE,
+                    schedule_module.track_pinned_message
+                ), group=-1)
             
             # Кнопки клавиатуры
             if hasattr(schedule_module, 'tomorrow_events'):
@@ -2750,7 +2785,10 @@ def main():
                                             event['category'] = new_name
                                             updated = True
                                     
-                                    if updated and hasattr(schedule_module, 'update_user_event'):
+                                    if updated and hasattr(schedule_module, 'save_user_events'):
+                                        # События изменены на месте - сохраняем файл пользователя один раз
+                                        schedule_module.save_user_events(str(user_id), events)
+                                    elif updated and hasattr(schedule_module, 'update_user_event'):
                                         # Сохраняем обновленные события через update_user_event
                                         for event in events:
                                             if isinstance(event, dict) and event.get('category') == new_name and 'id' in event:
@@ -3255,10 +3293,17 @@ def main():
         except Exception as e:
             logger.error(f"Ошибка очистки tasks_data.json для пользователя {user_id}: {e}", exc_info=True)
         
-        # Очищаем события в schedule_data.json
+        # Очищаем события расписания пользователя (файл пользователя в schedule_events/)
+        schedule_module = context.application.bot_data.get('schedule_module')
         try:
             schedule_path = str(DATA_DIR / 'schedule_data.json')
-            if os.path.exists(schedule_path):
+            if schedule_module and hasattr(schedule_module, 'save_user_events'):
+                # Модуль расписания держит события в памяти - очищаем через него, иначе кэш перезапишет файл.
+                # Перезаписывается только файл этого пользователя, остальные не трогаем
+                if user_id in schedule_module.load_data():
+                    schedule_module.save_user_events(user_id, [])
+            elif os.path.exists(schedule_path):
+                # Без модуля расписания остается только старый общий файл schedule_data.json
                 with open(schedule_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                 if user_id in data:
@@ -3275,7 +3320,7 @@ def main():
                 with open(schedule_path, 'w', encoding='utf-8') as f:
                     json.dump(data, f, ensure_ascii=False, indent=2)
         except Exception as e:
-            logger.error(f"Ошибка очистки schedule_data.json для пользователя {user_id}: {e}", exc_info=True)
+            logger.error(f"Ошибка очистки событий расписания для пользователя {user_id}: {e}", exc_info=True)
         
         # Очищаем shared_projects.json (совместные проекты)
         try:
@@ -3300,33 +3345,46 @@ def main():
             logger.error(f"Ошибка очистки shared_projects.json для пользователя {user_id}: {e}", exc_info=True)
         
         # Очищаем вспомогательные файлы с сообщениями (если есть)
-        try:
-            for path in [
-                str(DATA_DIR / 'user_messages.json'),
-                str(DATA_DIR / 'user_sent_messages.json')
-            ]:
-                if os.path.exists(path):
-                    try:
-                        with open(path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                        if isinstance(data, dict) and user_id in data:
-                            data.pop(user_id, None)
-                            # Бэкап перед перезаписью
-                            import shutil as _shutil
-                            backup_path = f"{path}.bak"
-                            try:
-                                _shutil.copy2(path, backup_path)
-                            except Exception:
-                                pass
+        if schedule_module and hasattr(schedule_module, 'get_messages_data'):
+            # Кэши ID сообщений модуля расписания в памяти
+            try:
+                for get_data, save in [
+                    (schedule_module.get_messages_data, schedule_module.save_messages),
+                    (schedule_module.get_user_sent_messages_data, schedule_module.save_user_sent_messages)
+                ]:
+                    messages_data = get_data()
+                    if messages_data.pop(user_id, None) is not None:
+                        save(messages_data)
+            except Exception as e:
+                logger.error(f"Ошибка очистки кеша сообщений для пользователя {user_id}: {e}", exc_info=True)
+        else:
+            try:
+                for path in [
+                    str(DATA_DIR / 'user_messages.json'),
+                    str(DATA_DIR / 'user_sent_messages.json')
+                ]:
+                    if os.path.exists(path):
+                        try:
+                            with open(path, 'r', encoding='utf-8') as f:
+                                data = json.load(f)
+                            if isinstance(data, dict) and user_id in data:
+                                data.pop(user_id, None)
+                                # Бэкап перед перезаписью
+                                import shutil as _shutil
+                                backup_path = f"{path}.bak"
+                                try:
+                                    _shutil.copy2(path, backup_path)
+                                except Exception:
+                                    pass
 
+                                with open(path, 'w', encoding='utf-8') as f:
+                                    json.dump(data, f, ensure_ascii=False, indent=2)
+                        except Exception:
+                            # В крайнем случае просто очищаем файл
                             with open(path, 'w', encoding='utf-8') as f:
-                                json.dump(data, f, ensure_ascii=False, indent=2)
-                    except Exception:
-                        # В крайнем случае просто очищаем файл
-                        with open(path, 'w', encoding='utf-8') as f:
-                            f.write('{}')
-        except Exception as e:
-            logger.error(f"Ошибка очистки файлов сообщений для пользователя {user_id}: {e}", exc_info=True)
+                                f.write('{}')
+            except Exception as e:
+                logger.error(f"Ошибка очистки файлов сообщений для пользователя {user_id}: {e}", exc_info=True)
         
         # Сообщаем пользователю
         await update.message.reply_text(
@@ -4128,6 +4186,13 @@ def main():
             logger.error("Затем запустите бота заново.")
         else:
             logger.error(f"Ошибка при запуске бота: {e}", exc_info=True)
+    finally:
+        # Модуль расписания хранит данные в памяти и пишет их на диск отложенно
+        if schedule_module and hasattr(schedule_module, 'wait_for_pending_writes'):
+            try:
+                schedule_module.wait_for_pending_writes()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении данных расписания: {e}", exc_info=True)
 
 if __name__ == '__main__':
     main()